@@ -1,26 +1,72 @@
 import os
 import subprocess
 import csv
+import json
 import threading
 import sys
 import datetime
 import pathlib
+import time
+import tempfile
 from supabase import create_client, Client
+from fleet_state import FleetState
+from run_log import RunLogWriter
+import metrics
+import tracing
+import triage
+import profiler
+from operation_poller import OperationPoller
 
 # ------------------------------------------------------------------- #
 # 1)  open a dated log-file that will receive *everything* we print   #
+#     (written by a background thread, rotated and gzipped by size)   #
 # ------------------------------------------------------------------- #
-LOGFILE = pathlib.Path(
-    f"run_{datetime.datetime.now():%Y%m%d_%H%M%S}.log"
-).open("a", encoding="utf-8")
+LOG_NAME = f"run_{datetime.datetime.now():%Y%m%d_%H%M%S}"
+LOGFILE = RunLogWriter(
+    str(pathlib.Path(f"{LOG_NAME}.log")),
+    max_bytes=int(os.environ.get("LOG_MAX_BYTES", str(100 * 1024 * 1024))),
+    flush_interval=float(os.environ.get("LOG_FLUSH_SECONDS", "1")),
+    jsonl_path=f"{LOG_NAME}.jsonl" if os.environ.get("LOG_JSONL") else None,
+)
 
 # Supabase configuration
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 BATCH_ID = os.environ.get("BATCH_ID", "local")
 
-# Lock to synchronize console output from multiple threads
-print_lock = threading.Lock()
+# Input / worker overrides (used by benchmark.py against the mock Teal server)
+EIDS_FILE = os.environ.get("EIDS_FILE", "eids_fallback.csv")
+TEALUS_SCRIPT = os.environ.get("TEALUS_SCRIPT", "TealUS_fallback.py")
+# 0 = start every EID at once (the historical behaviour)
+MAX_PARALLELISM = int(os.environ.get("MAX_PARALLELISM", "0"))
+# Optional path of a JSON file receiving per-EID status and duration (null when never started)
+RESULTS_JSON = os.environ.get("RESULTS_JSON")
+# Bulk pre-flight triage before any worker starts (TRIAGE=0 disables it)
+TRIAGE = os.environ.get("TRIAGE", "1") != "0"
+
+# Metrics: serve on METRICS_PORT and/or write a textfile-collector file
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE")
+IN_FLIGHT = metrics.REGISTRY.gauge("teal_eids_in_flight", "EIDs with a running worker")
+UTILISATION = metrics.REGISTRY.gauge("teal_worker_utilisation",
+                                     "Share of worker slots in use (MAX_PARALLELISM, or every EID when 0)")
+EIDS_FINISHED = metrics.REGISTRY.counter("teal_eids_finished_total", "Finished EIDs by result")
+collector: metrics.Collector | None = None
+# Worker slots of this run: MAX_PARALLELISM, or the number of workers started when unlimited
+worker_slots = 0
+
+# In-memory state of every EID in this run, fed by the workers' @@STATE lines
+fleet = FleetState()
+STATE_MARKER = "@@STATE "
+
+# The batch's one /operation-result poller: triage and every worker's @@AWAIT waits share it
+POLLER = OperationPoller(triage.get_operation_result,
+                         on_pending=lambda request_id: metrics.RETRIES.inc(reason='operation_pending'))
+AWAIT_MARKER = "@@AWAIT "
+
+# Wall-clock start/end of every worker, keyed by EID
+eid_started: dict[str, float] = {}
+eid_finished: dict[str, float] = {}
 
 # Initialize Supabase client
 supabase: Client | None = None
@@ -51,29 +97,115 @@ def push_result(batch_id: str, eid: str, status: str) -> None:
                 "eid": eid,
                 "status": status,
                 "updated_at": datetime.datetime.utcnow().isoformat()
-            }).execute()
+            }, on_conflict="batch_id,eid").execute()
         except Exception as e:
             print(f"Failed to push result to Supabase: {e}")
 
 def safe_print(message: str, eid: str = "", level: str = "INFO") -> None:
     """Thread-safe print helper that prefixes [hh:mm:ss], 
-       logs to file, and logs to Supabase."""
+       queues the line for console + log file, and logs to Supabase."""
     timestamp = datetime.datetime.now().strftime("%H:%M:%S")
     line = f"[{timestamp}] {message}"
-    
-    with print_lock:
-        print(line, flush=True)
-        LOGFILE.write(line + "\n")
-        LOGFILE.flush()
+
+    LOGFILE.write(line, level=level, eid=eid, message=message)
     
     # Also log to Supabase if available
     if supabase and eid:
         log_to_supabase(BATCH_ID, eid, level, message)
 
-def read_output(process, idx, eid):
+def start_metrics() -> dict:
+    """Start the metrics endpoint / textfile writer; returns env vars for the workers."""
+    global collector
+    if not METRICS_PORT and not METRICS_TEXTFILE:
+        return {}
+
+    directory = metrics.METRICS_DIR or tempfile.mkdtemp(prefix="teal_metrics_")
+    collector = metrics.Collector(metrics.REGISTRY, directory)
+    if METRICS_PORT:
+        collector.serve(METRICS_PORT)
+        safe_print(f"Serving metrics on :{METRICS_PORT}/metrics")
+    if METRICS_TEXTFILE:
+        def loop():
+            while True:
+                collector.write_textfile(METRICS_TEXTFILE)
+                time.sleep(metrics.METRICS_FLUSH_SECONDS)
+        threading.Thread(target=loop, daemon=True).start()
+    return {"METRICS_DIR": directory}
+
+def update_utilisation() -> None:
+    if worker_slots:
+        UTILISATION.set(IN_FLIGHT.value() / worker_slots)
+
+def worker_done(process, status: str) -> None:
+    """Update in-flight gauges and fold the worker's final metrics into the totals."""
+    IN_FLIGHT.dec()
+    update_utilisation()
+    EIDS_FINISHED.inc(result=status)
+    if collector:
+        collector.absorb(process.pid)
+
+def triage_log(message: str) -> None:
+    safe_print(message, level="WARNING")
+
+def run_triage(eids: list) -> dict:
+    """Triage every EID up front, store the outcome with the batch and seed the fleet store."""
+    safe_print(f"Triage: querying eSIM info for {len(eids)} EIDs...")
+    with tracing.span("triage", eids=len(eids)):
+        results = triage.triage_batch(eids, poller=POLLER, log=triage_log)
+    triage.store_results(supabase, BATCH_ID, results, log=triage_log)
+
+    for eid, result in results.items():
+        for plan in triage.PLANS:
+            if plan["name"] not in result.missing_plans:
+                fleet.set_plan_status(eid, plan["name"], "SUCCESS")
+        if result.category == triage.COMPLETE:
+            fleet.set_phase(eid, "SUCCESS")
+        elif result.category == triage.DEFERRED:
+            fleet.set_phase(eid, "DEFERRED")
+            fleet.set_device_status(eid, "OFFLINE")
+
+    summary = ", ".join(f"{category}={n}" for category, n in triage.summarise(results).items())
+    safe_print(f"Triage: {summary}")
+    if supabase and BATCH_ID != "local":
+        log_to_supabase(BATCH_ID, None, "INFO", f"Triage: {summary}")
+    return results
+
+def relay_wait(process, request: dict) -> None:
+    """Poll a worker's operation on the batch poller and write the outcome to its stdin."""
+    def reply(future):
+        if future.cancelled():
+            message = {"error": "Operation poller is closed."}
+        elif future.exception() is not None:
+            message = {"error": str(future.exception()),
+                       "unknown": isinstance(future.exception(), triage.UnknownOperation)}
+        else:
+            message = {"result": future.result()}
+        try:
+            process.stdin.write(json.dumps(message) + "\n")
+            process.stdin.flush()
+        except (OSError, ValueError):
+            pass  # worker already gone
+
+    parent = tracing.SpanContext(request["trace_id"], request["span_id"]) if request.get("span_id") else None
+    POLLER.submit(request["request_id"], request.get("delay", 0), request.get("timeout"),
+                  callback=reply, parent=parent)
+
+def read_output(process, idx, eid, slots=None):
     # Read stdout
     for raw in process.stdout:
         text = raw.rstrip()
+        if text.startswith(AWAIT_MARKER):
+            try:
+                relay_wait(process, json.loads(text[len(AWAIT_MARKER):]))
+            except (ValueError, KeyError) as e:
+                safe_print(f"[Worker #{idx + 1}: EID {eid}] -> bad await request: {e}", eid=eid, level="WARNING")
+            continue
+        if text.startswith(STATE_MARKER):
+            try:
+                fleet.apply(eid, json.loads(text[len(STATE_MARKER):]))
+            except (ValueError, KeyError) as e:
+                safe_print(f"[Worker #{idx + 1}: EID {eid}] -> bad state update: {e}", eid=eid, level="WARNING")
+            continue
         safe_print(f"[Worker #{idx + 1}: EID {eid}] -> {text}", eid=eid)
     
     # Read stderr
@@ -81,6 +213,16 @@ def read_output(process, idx, eid):
         text = raw.rstrip()
         safe_print(f"[Worker #{idx + 1}: EID {eid} ERROR] -> {text}", eid=eid, level="ERROR")
 
+    return_code = process.wait()
+    eid_finished[eid] = time.time()
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+    worker_done(process, 'PASS' if return_code == 0 else 'FAIL')
+    if slots:
+        slots.release()
+
 def update_batch_status(status: str, counts: dict = None) -> None:
     """Update batch status in Supabase."""
     if supabase and BATCH_ID != "local":
@@ -90,7 +232,7 @@ def update_batch_status(status: str, counts: dict = None) -> None:
                 "updated_at": datetime.datetime.utcnow().isoformat()
             }
             
-            if status == "COMPLETED" or status == "FAILED":
+            if status in ("COMPLETED", "FAILED", "DEFERRED"):
                 update_data["completed_at"] = datetime.datetime.utcnow().isoformat()
             
             if counts:
@@ -102,11 +244,14 @@ def update_batch_status(status: str, counts: dict = None) -> None:
             print(f"Failed to update batch status: {e}")
 
 def main():
+    global worker_slots
+    profiler.start_from_env("parent")
+
     # Get the directory where the script is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
 
     # Path to the CSV file
-    eids_file = os.path.join(script_dir, 'eids_fallback.csv')
+    eids_file = os.path.join(script_dir, EIDS_FILE)
 
     # Read EIDs from CSV
     eids = []
@@ -127,19 +272,57 @@ def main():
         return
 
     safe_print(f"Processing {len(eids)} EIDs for batch: {BATCH_ID}")
+    for eid in eids:
+        fleet.add(eid)
     
     # Update batch status to RUNNING
     update_batch_status("RUNNING")
+    metrics_env = start_metrics()
+
+    results = {}
+    success_count = 0
+    failure_count = 0
+    deferred_count = 0
+
+    # Submissions a previous run left in flight and that are too old to re-poll
+    pruned = triage.INFLIGHT.prune()
+    if pruned:
+        safe_print(f"Removed {pruned} stale in-flight operation files")
+
+    # Pre-flight triage: finish already-provisioned EIDs now and leave offline ones for a later run
+    triaged = run_triage(eids) if TRIAGE else {}
+    to_run = []
+    for eid in eids:
+        category = triaged[eid].category if eid in triaged else triage.NEEDS_ACTIVATION
+        if category == triage.COMPLETE:
+            results[eid] = 'PASS'
+            success_count += 1
+        elif category == triage.DEFERRED:
+            results[eid] = 'DEFERRED'
+            deferred_count += 1
+        else:
+            to_run.append(eid)
 
     # Path to TealUS.py
-    tealus_path = os.path.join(script_dir, 'TealUS_fallback.py')
+    tealus_path = os.path.join(script_dir, TEALUS_SCRIPT)
+
+    # Optionally cap the number of workers alive at once
+    slots = threading.BoundedSemaphore(MAX_PARALLELISM) if MAX_PARALLELISM > 0 else None
+    worker_slots = MAX_PARALLELISM if MAX_PARALLELISM > 0 else len(to_run)
 
     # Start subprocesses for each EID
     processes = []
-    for idx, eid in enumerate(eids):
+    for idx, eid in enumerate(to_run):
+        if slots:
+            slots.acquire()
         # Create environment with batch ID
         env = os.environ.copy()
         env["BATCH_ID"] = BATCH_ID
+        env["CENTRAL_POLL"] = "1"
+        env.update(metrics_env)
+        if eid in triaged and triaged[eid].category == triage.PARTIAL:
+            env["TRIAGE_START"] = "ASSIGNMENT"
+            env["TRIAGE_MISSING_PLANS"] = ",".join(triaged[eid].missing_plans)
         
         process = subprocess.Popen(
             [sys.executable, tealus_path],
@@ -151,24 +334,24 @@ def main():
             cwd=script_dir,
             env=env
         )
+        eid_started[eid] = time.time()
+        IN_FLIGHT.inc()
+        update_utilisation()
+        # stdin stays open: relay_wait() answers the worker's @@AWAIT requests on it
         process.stdin.write(f"{eid}\n")
         process.stdin.flush()
-        process.stdin.close()
 
-        t = threading.Thread(target=read_output, args=(process, idx, eid))
+        t = threading.Thread(target=read_output, args=(process, idx, eid, slots))
         t.start()
         processes.append((process, eid, t))
 
     # Gather results
-    results = {}
-    success_count = 0
-    failure_count = 0
-    
     for process, eid, t in processes:
         return_code = process.wait()
         t.join()
         status = 'PASS' if return_code == 0 else 'FAIL'
         results[eid] = status
+        fleet.set_phase(eid, 'SUCCESS' if return_code == 0 else 'FAILED')
         
         if status == 'PASS':
             success_count += 1
@@ -183,17 +366,41 @@ def main():
     safe_print(f"Total EIDs: {len(eids)}")
     safe_print(f"Successful: {success_count}")
     safe_print(f"Failed: {failure_count}")
+    safe_print(f"Deferred: {deferred_count}")
+    safe_print("Phase counts: " + ", ".join(f"{phase}={n}" for phase, n in fleet.progress().items() if n))
     
     for eid, status in results.items():
         safe_print(f"{eid}: {status}")
 
+    if RESULTS_JSON:
+        with open(RESULTS_JSON, "w", encoding="utf-8") as fh:
+            json.dump({
+                eid: {
+                    "status": status,
+                    # null for EIDs triage settled without starting a worker
+                    "duration_seconds": eid_finished[eid] - eid_started[eid] if eid in eid_started else None,
+                }
+                for eid, status in results.items()
+            }, fh)
+
     # Update batch with final status
-    final_status = 'COMPLETED' if failure_count == 0 else 'FAILED'
+    # offline EIDs were never provisioned: the batch is not done until a later run picks them up
+    if failure_count:
+        final_status = 'FAILED'
+    elif deferred_count:
+        final_status = 'DEFERRED'
+    else:
+        final_status = 'COMPLETED'
     update_batch_status(final_status, {"success": success_count, "failure": failure_count})
     
+    if collector and METRICS_TEXTFILE:
+        collector.write_textfile(METRICS_TEXTFILE)
+
     # Calculate and log timing
     safe_print(f"\nBatch {BATCH_ID} finished with status: {final_status}")
 
+    POLLER.close()
+    tracing.TRACER.close_all('OK')
     LOGFILE.close()
 
 if __name__ == '__main__':
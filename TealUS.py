@@ -1,9 +1,21 @@
+import profiler
+if __name__ == '__main__':
+    # before the heavy imports below, so worker start-up shows up in the profile
+    profiler.start_from_env('worker')
+
 import uuid
 import requests
-import time
 import datetime
 import sys
 import os
+import json
+import time
+import clock
+import metrics
+import tracing
+from operation_poller import OperationPoller
+from inflight_registry import InflightRegistry
+from metrics import API_SECONDS, API_RESPONSES, PHASE_SECONDS, RETRIES, DEDUPLICATED
 from supabase import create_client, Client
 
 # Teal API credentials - can be from environment or hardcoded for testing
@@ -22,11 +34,8 @@ BATCH_ID = os.environ.get("BATCH_ID", "local")
 supabase: Client | None = None
 if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
     supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-    print(f"Supabase client initialized for batch: {BATCH_ID}")
-else:
-    print("Warning: Supabase credentials not found. Database operations will be skipped.")
 
-BASE_URL = 'https://integrationapi.teal.global/api/v1'
+BASE_URL = os.environ.get("TEAL_BASE_URL", 'https://integrationapi.teal.global/api/v1')
 HEADERS = {
     'ApiKey': API_KEY,
     'ApiSecret': API_SECRET,
@@ -36,6 +45,80 @@ HEADERS = {
 # Callback URL
 CALLBACK_URL = 'https://sqs.us-east-2.amazonaws.com/404383143741/liveu-api-notification-queue-prod'
 
+# List of plan UUIDs (profiles), assigned in this order
+PLANS = [
+    {'name': 'TMO', 'uuid': 'cda438862b284bcdaec82ee516eada14'},
+    {'name': 'Verizon', 'uuid': '3c8fbbbc3ab442b8bc2f244c5180f9d1'},
+    {'name': 'Global', 'uuid': '493bdfc2eccb415ea63796187f830784'},
+    {'name': 'ATT', 'uuid': 'cd27b630772d4d8f915173488b7bfcf1'}
+]
+
+# Set by ParallelProcessor_US from the pre-flight triage (see triage.py)
+TRIAGE_START = os.environ.get("TRIAGE_START", "ACTIVATION")
+TRIAGE_MISSING_PLANS = [name for name in os.environ.get("TRIAGE_MISSING_PLANS", "").split(",") if name]
+
+# Prefix of the machine-readable state lines picked up by ParallelProcessor_US
+STATE_MARKER = '@@STATE '
+# Set by ParallelProcessor_US: operation waits are handed to the runner's poller as
+# AWAIT_MARKER lines and the result comes back as one JSON line on stdin
+CENTRAL_POLL = os.environ.get("CENTRAL_POLL") == "1"
+AWAIT_MARKER = '@@AWAIT '
+
+# Submitted-but-unresolved operations; survives restarts via INFLIGHT_DIR (see inflight_registry.py)
+INFLIGHT = InflightRegistry()
+
+
+def teal_request(method: str, endpoint: str, **kwargs) -> requests.Response:
+    """Call a Teal endpoint, recording its latency and response code."""
+    request_id = kwargs.get('params', {}).get('requestId')
+    with tracing.span(f'teal {method} {endpoint}', endpoint=endpoint, requestId=request_id) as call:
+        started = time.perf_counter()
+        try:
+            response = requests.request(method, f'{BASE_URL}{endpoint}', headers=HEADERS, **kwargs)
+        except requests.RequestException:
+            API_RESPONSES.inc(endpoint=endpoint, code='error')
+            raise
+        finally:
+            API_SECONDS.observe_since(started, endpoint=endpoint)
+        call.attributes['http.status'] = response.status_code
+    API_RESPONSES.inc(endpoint=endpoint, code=response.status_code)
+    return response
+
+
+# Phases begun but not yet ended; main() records whatever a raise / sys.exit leaves open
+_open_phases: list[tracing.Span] = []
+
+
+def begin_phase(name: str, **attributes) -> tracing.Span:
+    """Open a workflow phase span; end_phase() closes it and records the phase histogram."""
+    phase = tracing.start_span(f'phase.{name}', phase=name, **attributes)
+    _open_phases.append(phase)
+    return phase
+
+
+def end_phase(phase: tracing.Span, outcome: str = 'ok') -> None:
+    if not any(open_phase is phase for open_phase in _open_phases):
+        return
+    _open_phases.remove(phase)
+    if outcome != 'ok':
+        # spans the failure left open inside the phase (e.g. the failing assignment attempt) failed with it
+        while isinstance(tracing.TRACER.current(), tracing.Span) and tracing.TRACER.current() is not phase:
+            tracing.end_span(tracing.TRACER.current(), 'ERROR')
+    tracing.end_span(phase, 'OK' if outcome == 'ok' else 'ERROR')
+    labels = {key: phase.attributes[key] for key in ('phase', 'plan') if key in phase.attributes}
+    PHASE_SECONDS.observe(phase.duration, outcome=outcome, **labels)
+
+
+def abort_phases(outcome: str = 'failed') -> None:
+    """Record the phases still open when the workflow fails, so slow failures reach the histogram."""
+    while _open_phases:
+        end_phase(_open_phases[-1], outcome)
+
+
+def report_state(**update) -> None:
+    """Emit a state update (phase, plan_status, iccid, request_id...) for the parent's fleet store."""
+    print(STATE_MARKER + json.dumps(update), flush=True)
+
 
 def insert_batch_log(level: str, message: str, eid: str = None) -> None:
     """Insert a log row into batch_logs for the current batch."""
@@ -52,7 +135,8 @@ def insert_batch_log(level: str, message: str, eid: str = None) -> None:
         log_row['eid'] = eid
 
     try:
-        supabase.table('batch_logs').insert(log_row).execute()
+        with tracing.span('supabase insert batch_logs'):
+            supabase.table('batch_logs').insert(log_row).execute()
     except Exception as exc:
         print(f"Failed to insert batch log: {exc}")
 
@@ -68,7 +152,8 @@ def update_esim_result(eid: str, data: dict) -> None:
         data['eid'] = eid
         data['updated_at'] = datetime.datetime.utcnow().isoformat()
 
-        supabase.table('esim_results').upsert(data).execute()
+        with tracing.span('supabase upsert esim_results', columns=','.join(sorted(data))):
+            supabase.table('esim_results').upsert(data, on_conflict='batch_id,eid').execute()
     except Exception as exc:
         print(f"Failed to update esim_results: {exc}")
 
@@ -81,9 +166,7 @@ def already_active(eid: str, plan_uuid: str) -> bool:
     try:
         info_op, rid = get_esim_info(eid)
 
-        time.sleep(30)
-
-        info = get_operation_result(rid)
+        info = await_operation(rid, 30)
         if not info or not info.get("entries"):
             return False  # can't prove it's active – don't skip
 
@@ -101,13 +184,13 @@ def already_active(eid: str, plan_uuid: str) -> bool:
 
 # verify if the fallback profile is set to true or false
 def verify_fallback_profile(eid, plan_uuid, plan_name):
+    phase = begin_phase('verification', plan=plan_name)
     print("Fetching eSIM info to confirm profile fallback lock...")
     insert_batch_log('INFO', f"Fetching eSIM info to confirm profile fallback lock for {plan_name}", eid)
 
     info_json_fallback, info_req_id = get_esim_info(eid)
     print("Waiting 60 seconds")
-    time.sleep(60)
-    info_result = get_operation_result(info_req_id)
+    info_result = await_operation(info_req_id, 60)
     if not info_result or not info_result.get("entries"):
         print("Could not retrieve eSIM info for verification.")
     else:
@@ -119,6 +202,7 @@ def verify_fallback_profile(eid, plan_uuid, plan_name):
             if cp.get("planUuid") == plan_uuid:
                 print(f"---> Plan '{plan_name}' fallbackProfile =", cp.get("fallbackProfile"))
                 break
+    end_phase(phase)
 
 
 def generate_request_id():
@@ -132,8 +216,14 @@ def activate_esim(eid):
     if not eid:
         raise ValueError("EID must be provided.")
 
+    # a previous run may have been stopped while this activation was still processing
+    request_id = reuse_pending(eid, 'activate')
+    if request_id:
+        print(f"Re-polling in-flight activation request {request_id}")
+        return request_id
+
     request_id = generate_request_id()
-    url = f'{BASE_URL}/esims/activate'
+    INFLIGHT.record(eid, 'activate', request_id)
 
     params = {
         'requestId': request_id,
@@ -143,39 +233,119 @@ def activate_esim(eid):
     payload = {
         'entries': [eid]
     }
-    response = requests.post(url, headers=HEADERS, params=params, json=payload)
+    response = teal_request('POST', '/esims/activate', params=params, json=payload)
 
     if response.status_code != 200:
+        INFLIGHT.resolve(request_id)
         raise Exception(f"Activation API call failed with status code {response.status_code}")
     result = response.json()
     if not result.get('success'):
+        INFLIGHT.resolve(request_id)
         raise Exception("Activation failed: success != true")
 
     return request_id
 
 
+class UnknownOperation(Exception):
+    """Teal has no operation with this requestId (the submission never reached it)."""
+
+
 def get_operation_result(request_id):
-    url = f'{BASE_URL}/operation-result'
     params = {'requestId': request_id}
-    response = requests.get(url, headers=HEADERS, params=params)
+    response = teal_request('GET', '/operation-result', params=params)
     if response.status_code == 102:
         # Operation is still processing
         return None
+    elif response.status_code == 404:
+        raise UnknownOperation(f"Unknown requestId {request_id}")
     elif response.status_code != 200:
         raise Exception(f"Operation result API call failed with status code {response.status_code}")
     return response.json()
 
 
+def reuse_pending(eid: str, operation: str, plan: str = '') -> str | None:
+    """
+    requestId of an earlier, not yet stale submission of the same operation
+    that Teal knows about, so the caller can re-poll it instead of submitting
+    a duplicate. None means a new submission is needed.
+    """
+    request_id = INFLIGHT.pending(eid, operation, plan)
+    if not request_id:
+        return None
+    try:
+        get_operation_result(request_id)
+    except UnknownOperation:
+        # the earlier request never got through
+        INFLIGHT.resolve(request_id)
+        return None
+    except Exception as exc:
+        # 429 / 5xx / network: Teal may well have it, so re-poll rather than submit a duplicate
+        print(f"Could not check in-flight request {request_id} ({exc}); re-polling it")
+    DEDUPLICATED.inc(operation=operation)
+    return request_id
+
+
+# Standalone workers poll on their own thread; under ParallelProcessor_US the runner's
+# single poller does it (see await_central)
+POLLER = OperationPoller(get_operation_result,
+                         on_pending=lambda request_id: RETRIES.inc(reason='operation_pending'))
+
+
+def await_central(request_id: str, delay: float, timeout: float | None, wait: tracing.Span):
+    """Hand the wait to the runner's poller and block on its reply."""
+    print(AWAIT_MARKER + json.dumps({
+        'request_id': request_id,
+        'delay': delay,
+        'timeout': timeout,
+        'trace_id': wait.trace_id,
+        'span_id': wait.span_id,
+    }), flush=True)
+    line = sys.stdin.readline()
+    if not line:
+        raise Exception("Runner closed the operation channel.")
+    reply = json.loads(line)
+    if reply.get('unknown'):
+        raise UnknownOperation(reply['error'])
+    if reply.get('error'):
+        raise Exception(reply['error'])
+    return reply.get('result')
+
+
+def await_operation(request_id: str, delay: float, timeout: float = None):
+    """Wait `delay` seconds, then poll until the operation leaves 102; None if it never does."""
+    caller = sys._getframe(1)
+    with tracing.span('await operation', wait=True, seconds=delay, requestId=request_id,
+                      function=caller.f_code.co_name, lineno=caller.f_lineno) as wait:
+        try:
+            if CENTRAL_POLL:
+                result = await_central(request_id, delay, timeout, wait)
+            else:
+                result = POLLER.wait(request_id, delay, timeout)
+        except UnknownOperation:
+            INFLIGHT.resolve(request_id)
+            raise
+    if result is not None:
+        INFLIGHT.resolve(request_id)
+    return result
+
+
 def get_esim_info(eid: str, max_retries: int = 5, delay: int = 30):
     """
     Fetches eSIM info, retrying up to `max_retries` times.
     Returns (response_json, request_id) so the caller
-    knows which requestId to poll in /operation-result.
+    knows which requestId to poll in /operation-result;
+    response_json is None when an in-flight request is reused.
     """
     last_err = None
 
     for attempt in range(1, max_retries + 1):
+        # an attempt whose response was lost may still have reached Teal
+        request_id = reuse_pending(eid, 'info')
+        if request_id:
+            return None, request_id
+
         request_id = generate_request_id()  # NEW id each try
+        INFLIGHT.record(eid, 'info', request_id)
         params = {
             "callbackUrl": CALLBACK_URL,
             "limit": 1,
@@ -184,8 +354,7 @@ def get_esim_info(eid: str, max_retries: int = 5, delay: int = 30):
         }
 
         try:
-            resp = requests.get(f"{BASE_URL}/esims/info",
-                                headers=HEADERS, params=params, timeout=30)
+            resp = teal_request('GET', '/esims/info', params=params, timeout=30)
             if resp.status_code == 200:
                 data = resp.json()
                 if data.get("success"):
@@ -193,20 +362,28 @@ def get_esim_info(eid: str, max_retries: int = 5, delay: int = 30):
                 last_err = "success != true"
             else:
                 last_err = f"HTTP {resp.status_code}"
+            INFLIGHT.resolve(request_id)  # rejected, nothing to re-poll
         except requests.RequestException as exc:
             last_err = str(exc)
 
         # back-off before next attempt
         if attempt < max_retries:
-            time.sleep(delay)
+            RETRIES.inc(reason='esim_info_error')
+            clock.sleep(delay)
 
     # all retries exhausted
     raise Exception(f"eSIM info request failed after {max_retries} attempts – {last_err}")
 
 
 def assign_plan(eid, plan_uuid, profile_lock):
+    # an assignment that timed out while still processing is re-polled, not resubmitted
+    request_id = reuse_pending(eid, 'assign-plan', plan_uuid)
+    if request_id:
+        print(f"Re-polling in-flight plan assignment {request_id}")
+        return request_id
+
     request_id = generate_request_id()
-    url = f'{BASE_URL}/esims/assign-plan'
+    INFLIGHT.record(eid, 'assign-plan', request_id, plan_uuid)
     params = {
         'requestId': request_id,
         'callbackUrl': CALLBACK_URL
@@ -225,11 +402,13 @@ def assign_plan(eid, plan_uuid, profile_lock):
         ]
     }
 
-    response = requests.post(url, headers=HEADERS, params=params, json=payload)
+    response = teal_request('POST', '/esims/assign-plan', params=params, json=payload)
     if response.status_code != 200:
+        INFLIGHT.resolve(request_id)
         raise Exception(f"Assign Plan API call failed with status code {response.status_code}")
     result = response.json()
     if not result.get('success'):
+        INFLIGHT.resolve(request_id)
         raise Exception("Plan assignment failed: success != true")
     return request_id
 
@@ -238,14 +417,13 @@ def check_device_status(eid):
     print()
     print("Requesting eSIM info to check device status...")
     insert_batch_log('INFO', "Checking device status...", eid)
+    report_state(phase='WAITING_ONLINE')
 
     # request_id_query_status = generate_request_id()
     info_json, info_request_id = get_esim_info(eid)
 
     print("Waiting for 30 seconds...")
-    time.sleep(30)
-
-    esim_info_result = get_operation_result(info_request_id)
+    esim_info_result = await_operation(info_request_id, 30)
     if not esim_info_result:
         raise Exception("Failed to retrieve eSIM info operation result.")
 
@@ -255,6 +433,7 @@ def check_device_status(eid):
 
     esim_entry = entries[0]
     device_status = esim_entry.get('deviceStatus')
+    report_state(device_status=device_status)
 
     if device_status != "ONLINE":
         print(f"Device status is '{device_status}'. Starting loop to check device status...")
@@ -263,16 +442,15 @@ def check_device_status(eid):
         for attempt in range(max_retries):
             print(f"Attempt {attempt + 1} of {max_retries}")
             print("Waiting for 2 minutes...")
+            RETRIES.inc(reason='device_offline')
 
-            time.sleep(120)
+            clock.sleep(120)
 
             # request_id_loop_status = generate_request_id()
             info_json, info_request_id = get_esim_info(eid)
 
             print("Waiting for 30 seconds...")
-            time.sleep(30)
-
-            esim_info_result = get_operation_result(info_request_id)
+            esim_info_result = await_operation(info_request_id, 30)
 
             if not esim_info_result:
                 raise Exception("Failed to retrieve eSIM info operation result.")
@@ -281,6 +459,7 @@ def check_device_status(eid):
                 raise Exception("No entries in eSIM info operation result")
             esim_entry = entries[0]
             device_status = esim_entry.get('deviceStatus')
+            report_state(device_status=device_status)
             if device_status == "ONLINE":
                 print("Device status is now ONLINE.")
                 insert_batch_log('INFO', "Device status is now ONLINE", eid)
@@ -293,134 +472,142 @@ def check_device_status(eid):
         print("Device status is ONLINE.")
 
 
-def main():
-    # Get EID from user input
-    eid = input("").strip()
-
-    if not eid:
-        print("Error: EID must be provided.")
-        sys.exit(1)
-
-    # Log start of processing
-    insert_batch_log('INFO', f"Starting processing for EID: {eid}", eid)
-
-    # List of plan UUIDs (profiles)
-    plans = [
-        {'name': 'TMO', 'uuid': 'cda438862b284bcdaec82ee516eada14'},
-        {'name': 'Verizon', 'uuid': '3c8fbbbc3ab442b8bc2f244c5180f9d1'},
-        {'name': 'Global', 'uuid': '493bdfc2eccb415ea63796187f830784'},
-        {'name': 'ATT', 'uuid': 'cd27b630772d4d8f915173488b7bfcf1'}
-    ]
+def ensure_active(eid):
+    """Activate the eSIM and wait until Teal reports it active; exits the worker on failure."""
+    # Activate eSIM
+    phase = begin_phase('activation')
+    request_id = activate_esim(eid)
+    print(f"Activation initiated with request ID: {request_id}")
+    insert_batch_log('INFO', f"Activation initiated with request ID: {request_id}", eid)
+    report_state(phase='ACTIVATING', request_id=request_id, next_due=clock.due_in(30))
 
-    # Initialize processing_started_at
+    # Update activation request ID in database
     update_esim_result(eid, {
-        'processing_started_at': datetime.datetime.utcnow().isoformat()
+        'activation_request_id': request_id
     })
 
-    try:
-        # Activate eSIM
-        request_id = activate_esim(eid)
-        print(f"Activation initiated with request ID: {request_id}")
-        insert_batch_log('INFO', f"Activation initiated with request ID: {request_id}", eid)
+    # Poll for activation result
+    print("Polling for activation result...")
+    print("Waiting for 30 seconds.")
+    max_wait_time = 300  # Maximum wait time in seconds (5 minutes)
+    activation_result = await_operation(request_id, 30, timeout=max_wait_time)
 
-        # Update activation request ID in database
+    if not activation_result or not activation_result.get('success'):
+        print("Activation failed or timed out.")
+        error_msg = "Activation failed or timed out."
+        insert_batch_log('ERROR', error_msg, eid)
         update_esim_result(eid, {
-            'activation_request_id': request_id
+            'error_message': error_msg,
+            'processing_completed_at': datetime.datetime.utcnow().isoformat()
         })
+        sys.exit(1)
+    else:
+        print("Activation request successful.")
+        insert_batch_log('INFO', "Activation request successful", eid)
+        end_phase(phase)
 
-        # Poll for activation result
-        print("Polling for activation result...")
-        print("Waiting for 30 seconds.")
-        time.sleep(30)
-        activation_result = None
-        max_wait_time = 300  # Maximum wait time in seconds (5 minutes)
-        poll_interval = 10  # Poll every 10 seconds
-        elapsed_time = 0
-
-        while elapsed_time < max_wait_time:
-            activation_result = get_operation_result(request_id)
-            if activation_result:
-                break
-            time.sleep(poll_interval)
-            elapsed_time += poll_interval
-
-        if not activation_result or not activation_result.get('success'):
-            print("Activation failed or timed out.")
-            error_msg = "Activation failed or timed out."
-            insert_batch_log('ERROR', error_msg, eid)
-            update_esim_result(eid, {
-                'error_message': error_msg,
-                'processing_completed_at': datetime.datetime.utcnow().isoformat()
-            })
-            sys.exit(1)
-        else:
-            print("Activation request successful.")
-            insert_batch_log('INFO', "Activation request successful", eid)
+    # Check if eSIM is active
+    phase = begin_phase('active_wait')
+    print("Requesting eSIM info to check if eSIM is active...")
+    insert_batch_log('INFO', "Checking if eSIM is active...", eid)
+    report_state(phase='WAITING_ACTIVE', request_id=None)
+
+    info_json, info_request_id = get_esim_info(eid)
 
-        # Check if eSIM is active
-        print("Requesting eSIM info to check if eSIM is active...")
-        insert_batch_log('INFO', "Checking if eSIM is active...", eid)
+    print("Waiting for 30 seconds...")
+    esim_info_result = await_operation(info_request_id, 30)
 
-        info_json, info_request_id = get_esim_info(eid)
+    if not esim_info_result:
+        raise Exception("Failed to retrieve eSIM info operation result.")
+    entries = esim_info_result.get('entries', [])
 
-        print("Waiting for 30 seconds...")
-        time.sleep(30)
+    if not entries:
+        raise Exception("No entries in eSIM info operation result")
 
-        esim_info_result = get_operation_result(info_request_id)
+    esim_entry = entries[0]
+    print(entries)
+    print()
+    print("----> ACTIVE RESULT: ", esim_entry.get('active'))
+    if not esim_entry.get('active'):
+        print()
+        print("eSIM is not active, starting loop to check activation status...")
+        insert_batch_log('INFO', "eSIM is not active, starting activation check loop...", eid)
+        max_retries = 16
+        for attempt in range(max_retries):
+            print(f"Attempt {attempt + 1} of {max_retries}")
+            print("Waiting for 2 minutes...")
+            RETRIES.inc(reason='esim_not_active')
 
-        if not esim_info_result:
-            raise Exception("Failed to retrieve eSIM info operation result.")
-        entries = esim_info_result.get('entries', [])
+            clock.sleep(120)
 
-        if not entries:
-            raise Exception("No entries in eSIM info operation result")
+            info_json_loop, info_request_id_loop = get_esim_info(eid)
 
-        esim_entry = entries[0]
-        print(entries)
-        print()
-        print("----> ACTIVE RESULT: ", esim_entry.get('active'))
-        if not esim_entry.get('active'):
+            print("Waiting for 30 seconds...")
+            esim_info_result = await_operation(info_request_id_loop, 30)
+
+            if not esim_info_result:
+                raise Exception("Failed to retrieve eSIM info operation result.")
+            entries = esim_info_result.get('entries', [])
+
+            if not entries:
+                raise Exception("No entries in eSIM info operation result")
+
+            esim_entry = entries[0]
             print()
-            print("eSIM is not active, starting loop to check activation status...")
-            insert_batch_log('INFO', "eSIM is not active, starting activation check loop...", eid)
-            max_retries = 16
-            for attempt in range(max_retries):
-                print(f"Attempt {attempt + 1} of {max_retries}")
-                print("Waiting for 2 minutes...")
+            print("----> ACTIVE RESULT: ", esim_entry.get('active'))
+            if esim_entry.get('active'):
+                print()
+                print("eSIM is now active.")
+                insert_batch_log('INFO', "eSIM is now active", eid)
+                break
+            else:
+                print()
+                print("eSIM is still not active.")
+        else:
+            raise Exception("SIM not active")
+    else:
+        print()
+        print("eSIM is active.")
+        insert_batch_log('INFO', "eSIM is active", eid)
+    end_phase(phase)
 
-                time.sleep(120)
 
-                info_json_loop, info_request_id_loop = get_esim_info(eid)
+def main():
+    # Get EID from user input
+    eid = input("").strip()
 
-                print("Waiting for 30 seconds...")
-                time.sleep(30)
+    if not eid:
+        print("Error: EID must be provided.")
+        sys.exit(1)
 
-                esim_info_result = get_operation_result(info_request_id_loop)
+    # reported here rather than at import: the runner imports this module for triage
+    if supabase:
+        print(f"Supabase client initialized for batch: {BATCH_ID}")
+    else:
+        print("Warning: Supabase credentials not found. Database operations will be skipped.")
 
-                if not esim_info_result:
-                    raise Exception("Failed to retrieve eSIM info operation result.")
-                entries = esim_info_result.get('entries', [])
+    metrics.start_worker_flusher()
+    tracing.install()
+    root = tracing.start_span('eid', eid=eid, batch_id=BATCH_ID)
 
-                if not entries:
-                    raise Exception("No entries in eSIM info operation result")
+    # Log start of processing
+    insert_batch_log('INFO', f"Starting processing for EID: {eid}", eid)
 
-                esim_entry = entries[0]
-                print()
-                print("----> ACTIVE RESULT: ", esim_entry.get('active'))
-                if esim_entry.get('active'):
-                    print()
-                    print("eSIM is now active.")
-                    insert_batch_log('INFO', "eSIM is now active", eid)
-                    break
-                else:
-                    print()
-                    print("eSIM is still not active.")
-            else:
-                raise Exception("SIM not active")
+    # Only the plans triage found missing (all of them without triage)
+    plans = [plan for plan in PLANS if not TRIAGE_MISSING_PLANS or plan['name'] in TRIAGE_MISSING_PLANS]
+
+    # Initialize processing_started_at
+    update_esim_result(eid, {
+        'processing_started_at': datetime.datetime.utcnow().isoformat()
+    })
+
+    try:
+        if TRIAGE_START == "ASSIGNMENT":
+            # triage already saw this eSIM active - go straight to the missing plans
+            print("Triage: eSIM already active - skipping activation.")
+            insert_batch_log('INFO', "Triage: eSIM already active - skipping activation", eid)
         else:
-            print()
-            print("eSIM is active.")
-            insert_batch_log('INFO', "eSIM is active", eid)
+            ensure_active(eid)
 
         # ---------------------PLAN ASSIGNMENT BELOW---------------------
 
@@ -434,15 +621,15 @@ def main():
             else:
                 profile_lock = "false"
 
-            # Check if plan is already active
-            if already_active(eid, plan_uuid):
+            # Check if plan is already active (triage has just checked the plans it hands us)
+            if not TRIAGE_MISSING_PLANS and already_active(eid, plan_uuid):
                 print(f"{eid}: plan '{plan_name}' already installed - skipping")
                 insert_batch_log('INFO', f"Plan '{plan_name}' already installed - skipping", eid)
 
                 # Update database with already active status
                 update_data = {
                     f"{plan_name.lower()}_status": "SUCCESS",
-                    f"{plan_name.lower()}_timestamp": datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                    f"{plan_name.lower()}_timestamp": datetime.datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S')
                 }
                 if plan_name.lower() == 'att':
                     update_data['att_iccid'] = "Already active"
@@ -450,25 +637,37 @@ def main():
                     update_data[f"{plan_name.lower()}_iccid"] = "Already active"
 
                 update_esim_result(eid, update_data)
+                report_state(plan=plan_name, plan_status='SUCCESS', iccid="Already active")
                 continue
             else:
                 print(f"{eid}: plan '{plan_name}' not installed - proceeding with assignment")
                 insert_batch_log('INFO', f"Plan '{plan_name}' not installed - proceeding with assignment", eid)
 
             # Check that the device is ONLINE before each plan assignment
+            phase = begin_phase('device_online_wait', plan=plan_name)
             check_device_status(eid)
+            end_phase(phase)
+
+            phase = begin_phase('assignment', plan=plan_name)
 
             max_plan_attempts = 4
             plan_assignment_successful = False
+            attempt_span = None
             # Outer loop for plan assignment retry
             for plan_attempt in range(1, max_plan_attempts + 1):
+                if attempt_span is not None:
+                    tracing.end_span(attempt_span, 'ERROR')  # a new attempt means the previous one failed
+                attempt_span = tracing.start_span('assignment.attempt', attempt=plan_attempt, plan=plan_name)
                 print()
                 print(f"Plan assignment attempt {plan_attempt} for plan '{plan_name}'")
                 insert_batch_log('INFO', f"Plan assignment attempt {plan_attempt} for plan '{plan_name}'", eid)
 
                 # Initiate plan assignment
                 assign_plan_request_id = assign_plan(eid, plan_uuid, profile_lock)
+                attempt_span.attributes['requestId'] = assign_plan_request_id
                 print(f"Plan assignment initiated with request ID: {assign_plan_request_id}")
+                report_state(phase='ASSIGNING', plan=plan_name, plan_status='PENDING',
+                             request_id=assign_plan_request_id, next_due=clock.due_in(30))
 
                 # Update plan request ID in database
                 update_data = {}
@@ -479,24 +678,22 @@ def main():
                 update_esim_result(eid, update_data)
 
                 print("Waiting for 30 seconds after plan assignment API call...")
-                time.sleep(30)
-
-                plan_result = get_operation_result(assign_plan_request_id)
+                plan_result = await_operation(assign_plan_request_id, 30)
                 if not plan_result or not plan_result.get('success'):
                     print("Plan assignment API call did not return success; retrying the assignment...")
+                    RETRIES.inc(reason='assign_not_success')
                     continue  # Retry the assignment
 
                 print("Plan assignment API call returned success.")
                 print("Waiting for 4 minutes before checking plan change status...")
-                time.sleep(240)
+                clock.sleep(240)
 
                 # Check planChangeStatus
                 print(f"Checking planChangeStatus for '{plan_name}'...")
                 esim_info_request_result, request_id_plan_check = get_esim_info(eid)
 
                 print("Waiting for 30 seconds before retrieving plan change status...")
-                time.sleep(30)
-                esim_info_result = get_operation_result(request_id_plan_check)
+                esim_info_result = await_operation(request_id_plan_check, 30)
                 if not esim_info_result:
                     raise Exception("Failed to retrieve eSIM info operation result.")
                 entries = esim_info_result.get('entries', [])
@@ -511,6 +708,7 @@ def main():
                     print("Plan change status is SUCCESS.")
                     insert_batch_log('INFO', f"Plan '{plan_name}' assigned successfully", eid)
                     plan_assignment_successful = True
+                    report_state(phase='VERIFYING', request_id=None)
                     verify_fallback_profile(eid, plan_uuid, plan_name)
                     break
 
@@ -530,17 +728,19 @@ def main():
                         if plan_name.lower() == 'att':
                             update_data.update({
                                 'att_status': 'FAILED',
-                                'att_timestamp': datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                                'att_timestamp': datetime.datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S')
                             })
                         else:
                             update_data.update({
                                 f"{plan_name.lower()}_status": 'FAILED',
-                                f"{plan_name.lower()}_timestamp": datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                                f"{plan_name.lower()}_timestamp": datetime.datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S')
                             })
                         update_esim_result(eid, update_data)
+                        report_state(phase='FAILED', plan=plan_name, plan_status='FAILED', request_id=None)
                         sys.exit(1)
                     else:
                         print("Retrying plan assignment due to FAILURE status...")
+                        RETRIES.inc(reason='plan_change_failure')
                         continue  # Retry outer loop
 
                 # Otherwise, if the status is neither SUCCESS nor FAILURE,
@@ -553,13 +753,13 @@ def main():
                     for nested_attempt in range(1, max_nested_retries + 1):
                         print(f"Nested check attempt {nested_attempt} of {max_nested_retries} for plan '{plan_name}'")
                         print("Waiting for 2 minutes...")
+                        RETRIES.inc(reason='plan_change_pending')
 
-                        time.sleep(120)
+                        clock.sleep(120)
 
                         esim_info_request_result, request_id_nested = get_esim_info(eid)
                         print("Waiting for 30 seconds before nested status check...")
-                        time.sleep(30)
-                        esim_info_result = get_operation_result(request_id_nested)
+                        esim_info_result = await_operation(request_id_nested, 30)
 
                         if not esim_info_result:
                             raise Exception("Failed to retrieve eSIM info operation result during nested check.")
@@ -575,6 +775,7 @@ def main():
                             insert_batch_log('INFO', f"Plan '{plan_name}' assigned successfully in nested check", eid)
                             nested_success = True
                             plan_assignment_successful = True
+                            report_state(phase='VERIFYING', request_id=None)
                             verify_fallback_profile(eid, plan_uuid, plan_name)
                             break
                         elif plan_change_status == "FAILURE":
@@ -590,6 +791,8 @@ def main():
                         else:
                             print("Nested check did not achieve SUCCESS; no more retries remaining.")
                         continue  # Retry the outer loop (or exit if no more attempts)
+            if attempt_span is not None:
+                tracing.end_span(attempt_span, 'OK' if plan_assignment_successful else 'ERROR')
 
             # If after all outer attempts the assignment is still not successful, exit with an error.
             if not plan_assignment_successful:
@@ -606,15 +809,18 @@ def main():
                 else:
                     update_data[f"{plan_name.lower()}_status"] = 'FAILED'
                 update_esim_result(eid, update_data)
+                report_state(phase='FAILED', plan=plan_name, plan_status='FAILED', request_id=None)
                 sys.exit(1)
 
+            end_phase(phase)
+
             # Upon a successful assignment, store the resulting data.
             ICCID = esim_entry.get('iccid')
             Status = plan_change_status
             last_connected_network = esim_entry.get('lastConnectedNetwork', {})
             Timestamp = last_connected_network.get('lastCdrNetworkConsumptionTime')
             if not Timestamp:
-                Timestamp = datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                Timestamp = datetime.datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S')
 
             print(f"Plan '{plan_name}' assigned successfully:")
             print(f"ICCID: {ICCID}")
@@ -636,6 +842,7 @@ def main():
                     f"{plan_name.lower()}_timestamp": Timestamp
                 })
             update_esim_result(eid, update_data)
+            report_state(plan=plan_name, plan_status='SUCCESS', iccid=ICCID)
 
         # Finish
         print()
@@ -648,6 +855,9 @@ def main():
             'processing_completed_at': completion_time.isoformat(),
             'status': 'SUCCESS'
         })
+        report_state(phase='SUCCESS')
+        INFLIGHT.clear(eid)
+        tracing.end_span(root)
 
     except Exception as e:
         print(f"Error: {e}")
@@ -661,6 +871,8 @@ def main():
             'status': 'FAILED'
         })
         sys.exit(1)
+    finally:
+        abort_phases()
 
 
 if __name__ == '__main__':
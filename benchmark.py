@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import resource
+
+import mock_teal_server
+
+# ------------------------------------------------------------------- #
+#  Throughput benchmark: runs ParallelProcessor_US + TealUS end to    #
+#  end against mock_teal_server.py with compressed (virtual) time.    #
+# ------------------------------------------------------------------- #
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _tree_rss_kb(root_pid: int) -> int:
+    """Sum of VmRSS over a process and all its descendants (Linux /proc only)."""
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{tid}/children") as fh:
+                    stack.extend(int(child) for child in fh.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of a process tree and keeps the peak."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_kb = max(self.peak_kb, _tree_rss_kb(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_once(size: int, args, base_url: str, workdir: str) -> dict:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    eids_file = os.path.join(workdir, f"eids_{size}.csv")
+    results_file = os.path.join(workdir, f"results_{size}.json")
+    with open(eids_file, "w") as fh:
+        for i in range(size):
+            fh.write(f"89049032{i:024d}\n")
+
+    env = os.environ.copy()
+    env.update({
+        "BATCH_ID": "local",
+        "SUPABASE_URL": "",  # never write benchmark rows to the real project
+        "SUPABASE_SERVICE_ROLE_KEY": "",
+        "TEAL_BASE_URL": base_url,
+        "TEAL_TIME_SCALE": str(args.time_scale),
+        "EIDS_FILE": eids_file,
+        "TEALUS_SCRIPT": "TealUS.py",
+        "MAX_PARALLELISM": str(args.workers),
+        "RESULTS_JSON": results_file,
+        # a fresh registry per run: leftovers from earlier runs would add re-poll calls
+        "INFLIGHT_DIR": os.path.join(workdir, f"inflight_{size}"),
+    })
+
+    started = time.time()
+    # run from the temp dir so the runner's run_*.log lands there, not in the repo
+    process = subprocess.Popen([sys.executable, os.path.join(script_dir, "ParallelProcessor_US.py")],
+                               cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sampler = RssSampler(process.pid)
+    sampler.start()
+    process.wait()
+    sampler.stop()
+    wall = time.time() - started
+
+    with open(results_file) as fh:
+        results = json.load(fh)
+
+    # durations are real seconds; divide by the scale to express them in workflow time.
+    # EIDs triage finished or deferred without a worker have none and stay out of the percentiles
+    latencies = [r["duration_seconds"] / args.time_scale for r in results.values()
+                 if r["duration_seconds"] is not None]
+    virtual_wall = wall / args.time_scale
+    passed = sum(1 for r in results.values() if r["status"] == "PASS")
+    return {
+        "eids": size,
+        "passed": passed,
+        "real_seconds": round(wall, 2),
+        "eids_per_hour": round(size / (virtual_wall / 3600), 1) if virtual_wall else 0.0,
+        "p50_eid_seconds": round(percentile(latencies, 50), 1),
+        "p99_eid_seconds": round(percentile(latencies, 99), 1),
+        "peak_rss_mb": round(max(sampler.peak_kb,
+                                 resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the eSIM pipeline against the mock Teal API')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Batch sizes to run')
+    parser.add_argument('--workers', type=int, default=200, help='MAX_PARALLELISM for the runner')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    mock_teal_server.add_config_arguments(parser)
+    parser.set_defaults(time_scale=0.01)
+    args = parser.parse_args()
+
+    server, teal = mock_teal_server.start_server(mock_teal_server.config_from_args(args))
+    base_url = f"http://127.0.0.1:{server.server_port}{mock_teal_server.API_PREFIX}"
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            teal.reset()
+            row = run_once(size, args, base_url, workdir)
+            stats = teal.stats()
+            row["api_calls_per_eid"] = round(stats["total_calls"] / size, 2)
+            row["api_calls"] = stats["calls"]
+            rows.append(row)
+            print(f"{size:>6} EIDs | {row['passed']:>6} passed | {row['eids_per_hour']:>10} EIDs/h | "
+                  f"{row['api_calls_per_eid']:>6} calls/EID | p50 {row['p50_eid_seconds']:>7}s | "
+                  f"p99 {row['p99_eid_seconds']:>7}s | peak RSS {row['peak_rss_mb']:>8} MB | "
+                  f"real {row['real_seconds']}s", flush=True)
+
+    server.shutdown()
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
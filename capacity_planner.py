@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import heapq
+import random
+import argparse
+import datetime
+from collections import defaultdict
+from supabase import create_client, Client
+
+from export_results import iter_result_pages
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://sciftjvjlpemhkvtokhi.supabase.co")
+
+PLAN_NAMES = ['TMO', 'Verizon', 'Global', 'ATT']
+
+# ------------------------------------------------------------------- #
+#  Workflow model                                                     #
+#  Each EID walks the phases below in order (see TealUS.main()).      #
+#  A phase ends at the first batch_logs milestone matching its regex  #
+#  and lasts since the previous milestone of the same EID.            #
+# ------------------------------------------------------------------- #
+
+PHASES = ['activation', 'active_wait'] + [f'plan_{name}' for name in PLAN_NAMES]
+
+MILESTONES = [
+    (re.compile(r"^Starting processing"), None),
+    (re.compile(r"^Activation request successful"), 'activation'),
+    (re.compile(r"^eSIM is (now )?active"), 'active_wait'),
+] + [
+    (re.compile(rf"^Plan '{name}' (assigned successfully|already installed)"), f'plan_{name}')
+    for name in PLAN_NAMES
+]
+
+# Nominal seconds per phase from the fixed waits in TealUS, used when there is no history
+DEFAULT_PHASE_SECONDS = {
+    'activation': 45,
+    'active_wait': 35,
+    # already_active 30 + device check 30 + assign 30 + 240 + status 30 + verify 60
+    **{f'plan_{name}': 420 for name in PLAN_NAMES},
+}
+
+# Teal calls implied by each batch_logs message (submit + operation-result poll)
+CALLS_PER_MESSAGE = [
+    (re.compile(r"^Activation initiated"), 2),
+    (re.compile(r"^Checking if eSIM is active"), 2),
+    (re.compile(r"^Checking device status"), 2),
+    (re.compile(r"^Device status is '"), 2),
+    (re.compile(r"^Plan '.*' (not installed|already installed)"), 2),  # already_active()
+    (re.compile(r"^Plan assignment attempt"), 4),  # assign + poll + planChangeStatus info + poll
+    (re.compile(r"^Fetching eSIM info to confirm profile fallback lock"), 2),
+]
+DEFAULT_CALLS_PER_EID = 2 + 2 + len(PLAN_NAMES) * (2 + 2 + 4 + 2)
+
+
+def parse_plan_ts(value: str | None) -> datetime.datetime | None:
+    """
+    `<plan>_timestamp` as naive UTC. TealUS writes dd/mm/YYYY HH:MM:SS in UTC;
+    Teal's lastCdrNetworkConsumptionTime and the edge function write ISO 8601.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%d/%m/%Y %H:%M:%S')
+    except ValueError:
+        return parse_ts(value)
+
+
+def parse_ts(value: str | None) -> datetime.datetime | None:
+    if not value:
+        return None
+    try:
+        ts = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return ts.replace(tzinfo=None) if ts.tzinfo is None else ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def iter_batch_logs(supabase: Client, batch_id: str, page_size: int = 1000):
+    """Yield batch_logs rows of a batch, keyset-paginated on id."""
+    last_id = None
+    while True:
+        query = (supabase.table('batch_logs')
+                 .select('id,eid,message,timestamp')
+                 .eq('batch_id', batch_id))
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(page_size).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]['id']
+
+
+class History:
+    """Per-phase duration samples and per-EID call counts collected from past batches."""
+
+    def __init__(self):
+        self.phase_samples: dict[str, list[float]] = defaultdict(list)
+        self.total_samples: list[float] = []
+        self.calls_samples: list[int] = []
+
+    def add_batch(self, supabase: Client, batch_id: str) -> None:
+        plan_times = {}
+        for rows in iter_result_pages(supabase, batch_id):
+            for row in rows:
+                started = parse_ts(row.get('processing_started_at'))
+                completed = parse_ts(row.get('processing_completed_at'))
+                if started and completed and completed > started:
+                    self.total_samples.append((completed - started).total_seconds())
+                plan_times[row['eid']] = {
+                    name: parse_plan_ts(row.get(f'{name.lower()}_timestamp'))
+                    for name in PLAN_NAMES
+                    # triage stamps already-active plans with the triage time, not a duration
+                    if row.get(f'{name.lower()}_iccid') != 'Already active'
+                }
+
+        events = defaultdict(list)
+        for log in iter_batch_logs(supabase, batch_id):
+            ts = parse_ts(log.get('timestamp'))
+            if log.get('eid') and ts:
+                events[log['eid']].append((ts, log.get('message') or ''))
+
+        for eid in events.keys() | plan_times.keys():
+            eid_events = sorted(events.get(eid, []))
+            self._add_eid(eid_events, plan_times.get(eid, {}))
+
+    def _add_eid(self, eid_events: list, plan_times: dict) -> None:
+        previous = None
+        calls = 0
+        ends = {}
+        for ts, message in eid_events:
+            for pattern, n in CALLS_PER_MESSAGE:
+                if pattern.match(message):
+                    calls += n
+                    break
+            for pattern, phase in MILESTONES:
+                if pattern.match(message):
+                    if phase and previous:
+                        self.phase_samples[phase].append((ts - previous).total_seconds())
+                        ends[phase] = ts
+                    previous = ts
+                    break
+        if calls:
+            self.calls_samples.append(calls)
+
+        # plan timestamps fill in plan phases the logs have no milestone for
+        # (batch_logs rows are best-effort; the esim_results row is always written)
+        previous = ends.get('active_wait')
+        for name in PLAN_NAMES:
+            phase = f'plan_{name}'
+            ts = ends.get(phase) or plan_times.get(name)
+            if phase not in ends and ts and previous and ts > previous:
+                self.phase_samples[phase].append((ts - previous).total_seconds())
+            previous = ts
+
+    def sample_eid(self, rng: random.Random) -> float:
+        """Draw one EID duration by sampling each phase independently."""
+        total = 0.0
+        for phase in PHASES:
+            samples = self.phase_samples.get(phase)
+            total += rng.choice(samples) if samples else DEFAULT_PHASE_SECONDS[phase]
+        return total
+
+    def mean_eid_seconds(self) -> float:
+        total = 0.0
+        for phase in PHASES:
+            samples = self.phase_samples.get(phase)
+            total += sum(samples) / len(samples) if samples else DEFAULT_PHASE_SECONDS[phase]
+        return total
+
+    def calibration(self) -> float:
+        """
+        Observed mean processing time over the phase model's mean. The phases
+        miss time between milestones (worker start-up, device checks, Supabase
+        writes); scaling by this ratio puts it back. 1.0 without history.
+        """
+        if not self.total_samples:
+            return 1.0
+        return (sum(self.total_samples) / len(self.total_samples)) / self.mean_eid_seconds()
+
+    def mean_calls_per_eid(self) -> float:
+        if not self.calls_samples:
+            return float(DEFAULT_CALLS_PER_EID)
+        return sum(self.calls_samples) / len(self.calls_samples)
+
+
+class LoadModel:
+    """
+    How much longer an EID takes when `busy` workers run at once:
+      - Teal latency grows as the offered call rate nears --api-capacity (1/(1-rho));
+      - calls beyond capacity are answered 429 and retried after --retry-delay,
+        and completed calls never exceed capacity;
+      - worker CPU (interpreter start-up, JSON, Supabase writes) beyond --cores
+        stretches every worker.
+    The offered load depends on the EID duration it stretches, so the duration
+    is solved by damped fixed-point iteration. History samples already contain
+    the unloaded latency; only the increase over one worker is applied.
+    """
+
+    def __init__(self, eid_seconds: float, calls_per_eid: float, api_latency: float, api_capacity: float,
+                 retry_delay: float, cpu_seconds: float, cores: int):
+        self.eid_seconds = eid_seconds
+        self.calls_per_eid = calls_per_eid
+        self.api_latency = api_latency
+        self.api_capacity = api_capacity
+        self.retry_delay = retry_delay
+        self.cpu_seconds = cpu_seconds
+        self.cores = cores
+        self._baseline = self._duration(1)[0]
+
+    def _duration(self, busy: int) -> tuple[float, float]:
+        """(seconds per EID, Teal calls/s offered) with `busy` concurrent workers."""
+        base = self.eid_seconds - self.calls_per_eid * self.api_latency
+        duration = self.eid_seconds
+        rate = 0.0
+        for _ in range(100):
+            rate = busy * self.calls_per_eid / duration
+            rho = rate / self.api_capacity if self.api_capacity else 0.0
+            rejected = min(1 - 1 / rho, 0.9) if rho > 1 else 0.0
+            latency = self.api_latency / (1 - min(rho, 0.95))
+            attempts = 1 / (1 - rejected)
+            api = self.calls_per_eid * (attempts * latency + (attempts - 1) * self.retry_delay)
+            target = base + api
+            if self.api_capacity:
+                # Teal completes at most api_capacity calls/s however many workers ask
+                target = max(target, busy * self.calls_per_eid / self.api_capacity)
+            cpu_demand = busy * self.cpu_seconds / target
+            target *= max(1.0, cpu_demand / self.cores)
+            if abs(target - duration) < 0.01:
+                break
+            duration = (duration + target) / 2
+        return duration, rate
+
+    def stretch(self, busy: int) -> float:
+        """Factor applied to sampled EID durations at this concurrency."""
+        return self._duration(busy)[0] / self._baseline
+
+    def call_rate(self, busy: int) -> float:
+        return self._duration(busy)[1]
+
+
+def simulate(history: History, eid_count: int, workers: int, rng: random.Random, stretch: float = 1.0) -> float:
+    """
+    Discrete-event simulation of one batch: EIDs are started in order as
+    soon as a worker slot frees up, so every start sees all `workers` slots
+    busy and each EID is stretched by that concurrency's load factor.
+    Returns the makespan in seconds.
+    """
+    free_at = [0.0] * min(workers, eid_count)
+    heapq.heapify(free_at)
+    makespan = 0.0
+    for _ in range(eid_count):
+        start = heapq.heappop(free_at)
+        end = start + history.sample_eid(rng) * stretch
+        makespan = max(makespan, end)
+        heapq.heappush(free_at, end)
+    return makespan
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def candidate_concurrencies(eid_count: int, max_workers: int) -> list[int]:
+    limit = min(eid_count, max_workers)
+    values = {1, limit}
+    step = 1
+    while step < limit:
+        values.update({step, step * 2, step * 3, step * 5, step * 7})
+        step *= 10
+    return sorted(v for v in values if v <= limit)
+
+
+def fmt_duration(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict batch duration and pick a worker count')
+    parser.add_argument('eid_count', type=int, help='Number of EIDs in the planned batch')
+    parser.add_argument('--history', nargs='*', default=[],
+                        help='Batch IDs to learn phase timings from (default: last --history-limit finished)')
+    parser.add_argument('--history-limit', type=int, default=5)
+    parser.add_argument('--max-workers', type=int, default=1000, help='Upper bound on concurrent workers')
+    parser.add_argument('--api-rate-limit', type=float, default=0.0,
+                        help='Hard cap on sustained Teal calls/second (0 = unlimited)')
+    parser.add_argument('--api-capacity', type=float, default=20.0,
+                        help='Teal calls/second before latency climbs and 429s start (0 = unlimited)')
+    parser.add_argument('--api-latency', type=float, default=0.5, help='Unloaded Teal call latency in seconds')
+    parser.add_argument('--retry-delay', type=float, default=30.0, help='Back-off before retrying a 429')
+    parser.add_argument('--worker-cpu-seconds', type=float, default=2.0,
+                        help='CPU seconds one EID worker uses (start-up included)')
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1, help='CPU cores of the runner host')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='Pick the smallest concurrency within this fraction of the best makespan')
+    parser.add_argument('--runs', type=int, default=20, help='Simulation runs per concurrency')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--service-key', help='Supabase service role key',
+                        default=os.environ.get('SUPABASE_SERVICE_ROLE_KEY'))
+    args = parser.parse_args()
+
+    history = History()
+    if args.service_key:
+        supabase = create_client(SUPABASE_URL, args.service_key)
+        batch_ids = args.history
+        if not batch_ids:
+            # failed and deferred batches too: a failure anywhere changes the batch status
+            rows = (supabase.table('batches').select('id').in_('status', ['COMPLETED', 'FAILED', 'DEFERRED'])
+                    .order('completed_at', desc=True).limit(args.history_limit).execute().data or [])
+            batch_ids = [row['id'] for row in rows]
+        for batch_id in batch_ids:
+            history.add_batch(supabase, batch_id)
+        print(f"Learned from {len(batch_ids)} batches, {len(history.total_samples)} completed EIDs")
+    else:
+        print("No Supabase key – using the nominal phase timings from TealUS")
+
+    print("\nPhase durations (seconds):")
+    for phase in PHASES:
+        samples = history.phase_samples.get(phase)
+        if samples:
+            print(f"  {phase:<14} n={len(samples):<6} p50={percentile(samples, 50):>8.0f} "
+                  f"p90={percentile(samples, 90):>8.0f}")
+        else:
+            print(f"  {phase:<14} (no history, using {DEFAULT_PHASE_SECONDS[phase]})")
+
+    rng = random.Random(args.seed)
+    calls_per_eid = history.mean_calls_per_eid()
+    calibration = history.calibration()
+    if history.total_samples:
+        print(f"\nModel check: observed mean EID {history.mean_eid_seconds() * calibration:.0f}s, "
+              f"phase model {history.mean_eid_seconds():.0f}s - scaling by {calibration:.2f}")
+    load = LoadModel(history.mean_eid_seconds() * calibration, calls_per_eid, args.api_latency,
+                     args.api_capacity, args.retry_delay, args.worker_cpu_seconds, args.cores)
+
+    print(f"\nConcurrency vs. predicted makespan for {args.eid_count} EIDs:")
+    results = []
+    for workers in candidate_concurrencies(args.eid_count, args.max_workers):
+        stretch = load.stretch(workers) * calibration
+        runs = [simulate(history, args.eid_count, workers, rng, stretch) for _ in range(args.runs)]
+        call_rate = load.call_rate(workers)
+        feasible = not args.api_rate_limit or call_rate <= args.api_rate_limit
+        results.append((workers, percentile(runs, 50), percentile(runs, 90), call_rate, feasible))
+        flag = '' if feasible else '  (exceeds API rate limit)'
+        print(f"  {workers:>6} workers  p50={fmt_duration(percentile(runs, 50)):>10}  "
+              f"p90={fmt_duration(percentile(runs, 90)):>10}  ~{call_rate:.1f} calls/s  "
+              f"x{load.stretch(workers):.2f} per EID{flag}")
+
+    feasible = [r for r in results if r[4]]
+    if not feasible:
+        print("\nNo concurrency satisfies the API rate limit.")
+        sys.exit(1)
+    best_makespan = min(r[1] for r in feasible)
+    best = next(r for r in feasible if r[1] <= best_makespan * (1 + args.tolerance))
+
+    print(f"\nRecommended concurrency: {best[0]} workers")
+    print(f"Predicted makespan: {fmt_duration(best[1])} (p90 {fmt_duration(best[2])})")
+    print(f"Expected Teal API calls: {calls_per_eid * args.eid_count:,.0f} "
+          f"({calls_per_eid:.1f} per EID, ~{best[3]:.1f}/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import os
+import time
+
+# ------------------------------------------------------------------- #
+#  Pluggable clock for the workflow's fixed waits.                    #
+#  TEAL_TIME_SCALE=0.01 makes a 120 s wait take 1.2 s, so the whole   #
+#  pipeline can be run against mock_teal_server.py in virtual time.   #
+# ------------------------------------------------------------------- #
+
+TIME_SCALE = float(os.environ.get("TEAL_TIME_SCALE", "1"))
+
+
+class Clock:
+    """Real wall clock."""
+
+    scale = 1.0
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def due_in(self, seconds: float) -> float:
+        """Wall-clock timestamp at which a wait of `seconds` (workflow time) ends."""
+        return self.time() + seconds * self.scale
+
+
+class ScaledClock(Clock):
+    """Clock whose sleeps are compressed by `scale`."""
+
+    def __init__(self, scale: float):
+        if scale <= 0:
+            raise ValueError("Time scale must be positive.")
+        self.scale = scale
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds * self.scale)
+
+
+_clock: Clock = ScaledClock(TIME_SCALE) if TIME_SCALE != 1 else Clock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(new_clock: Clock) -> None:
+    global _clock
+    _clock = new_clock
+
+
+def sleep(seconds: float) -> None:
+    _clock.sleep(seconds)
+
+
+def now() -> float:
+    return _clock.time()
+
+
+def due_in(seconds: float) -> float:
+    return _clock.due_in(seconds)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import os
+import sys
+import csv
+import argparse
+from supabase import create_client, Client
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://sciftjvjlpemhkvtokhi.supabase.co")
+
+CARRIERS = ['tmo', 'verizon', 'global', 'att']
+
+# Column order of the export – identity, timings, then per-carrier results
+COLUMNS = [
+    'id',
+    'batch_id',
+    'eid',
+    'activation_request_id',
+    'error_message',
+    'triage_category',
+    'triage_missing_plans',
+    'processing_started_at',
+    'processing_completed_at',
+    'processing_duration_seconds',
+    'created_at',
+    'updated_at',
+]
+for _carrier in CARRIERS:
+    COLUMNS += [
+        f'{_carrier}_iccid',
+        f'{_carrier}_status',
+        f'{_carrier}_timestamp',
+        f'{_carrier}_plan_request_id',
+    ]
+
+
+def iter_result_pages(supabase: Client, batch_id: str, page_size: int = 1000):
+    """
+    Yield esim_results rows for a batch one page at a time.
+    Uses keyset pagination on `id` so every page is an index range scan
+    instead of an ever-growing OFFSET.
+    """
+    last_id = None
+    while True:
+        query = (supabase.table('esim_results')
+                 .select(','.join(COLUMNS))
+                 .eq('batch_id', batch_id))
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def write_csv(pages, out) -> int:
+    writer = csv.DictWriter(out, fieldnames=COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    total = 0
+    for rows in pages:
+        writer.writerows(rows)
+        out.flush()
+        total += len(rows)
+    return total
+
+
+def write_parquet(pages, path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("Error: Parquet export requires pyarrow (pip install pyarrow)")
+        sys.exit(1)
+
+    schema = pa.schema([
+        (name, pa.float64() if name == 'processing_duration_seconds' else pa.string())
+        for name in COLUMNS
+    ])
+    total = 0
+    # one row group per page keeps memory flat regardless of batch size
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in pages:
+            columns = {name: [row.get(name) for row in rows] for name in COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            total += len(rows)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export eSIM results of a batch to CSV or Parquet')
+    parser.add_argument('batch_id', help='Batch ID to export')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output format')
+    parser.add_argument('--output', '-o',
+                        help='Output file (default: results_<batch_id>.<format>, "-" for stdout with csv)')
+    parser.add_argument('--page-size', type=int, default=1000, help='Rows fetched per request')
+    parser.add_argument('--service-key', help='Supabase service role key',
+                        default=os.environ.get('SUPABASE_SERVICE_ROLE_KEY'))
+
+    args = parser.parse_args()
+
+    if not args.service_key:
+        print("Error: SUPABASE_SERVICE_ROLE_KEY environment variable or --service-key argument required")
+        sys.exit(1)
+
+    supabase = create_client(SUPABASE_URL, args.service_key)
+    output = args.output or f"results_{args.batch_id}.{args.format}"
+    pages = iter_result_pages(supabase, args.batch_id, args.page_size)
+
+    if args.format == 'parquet':
+        if output == '-':
+            print("Error: Parquet output must be written to a file")
+            sys.exit(1)
+        total = write_parquet(pages, output)
+    elif output == '-':
+        total = write_csv(pages, sys.stdout)
+    else:
+        with open(output, 'w', newline='', encoding='utf-8') as fh:
+            total = write_csv(pages, fh)
+
+    print(f"Exported {total} rows for batch {args.batch_id} to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import heapq
+import threading
+
+# ------------------------------------------------------------------- #
+#  Compact in-memory state for every EID of a batch.                  #
+#  One slotted record per EID plus secondary indexes so the runner    #
+#  can answer "who is in phase X / waiting on plan Y / offline" and   #
+#  "who is due next" without touching Supabase.                       #
+# ------------------------------------------------------------------- #
+
+PHASES = (
+    'PENDING',
+    'ACTIVATING',
+    'WAITING_ACTIVE',
+    'WAITING_ONLINE',
+    'ASSIGNING',
+    'VERIFYING',
+    'SUCCESS',
+    'FAILED',
+    'DEFERRED',
+)
+PLAN_NAMES = ('TMO', 'Verizon', 'Global', 'ATT')
+PLAN_STATUSES = ('NONE', 'PENDING', 'SUCCESS', 'FAILED')
+DEVICE_STATUSES = ('UNKNOWN', 'ONLINE', 'OFFLINE')
+
+_PHASE_CODE = {name: code for code, name in enumerate(PHASES)}
+_PLAN_INDEX = {name: idx for idx, name in enumerate(PLAN_NAMES)}
+_PLAN_STATUS_CODE = {name: code for code, name in enumerate(PLAN_STATUSES)}
+_DEVICE_CODE = {name: code for code, name in enumerate(DEVICE_STATUSES)}
+
+# plan statuses are packed two bits per plan into a single int
+_PLAN_BITS = 2
+_PLAN_MASK = (1 << _PLAN_BITS) - 1
+
+
+class EidRecord:
+    """One EID's state, stored as small ints to keep a million of them cheap."""
+
+    __slots__ = ('eid', 'phase', 'plans', 'device', 'iccids', 'request_id', 'next_due')
+
+    def __init__(self, eid: str):
+        self.eid = eid
+        self.phase = 0
+        self.plans = 0
+        self.device = 0
+        self.iccids = None  # allocated lazily: list of 4 ICCIDs
+        self.request_id = None
+        self.next_due = None
+
+    def plan_status(self, plan_name: str) -> str:
+        shift = _PLAN_INDEX[plan_name] * _PLAN_BITS
+        return PLAN_STATUSES[(self.plans >> shift) & _PLAN_MASK]
+
+    def as_dict(self) -> dict:
+        return {
+            'eid': self.eid,
+            'phase': PHASES[self.phase],
+            'device_status': DEVICE_STATUSES[self.device],
+            'plans': {name: self.plan_status(name) for name in PLAN_NAMES},
+            'iccids': dict(zip(PLAN_NAMES, self.iccids)) if self.iccids else {},
+            'request_id': self.request_id,
+            'next_due': self.next_due,
+        }
+
+
+class FleetState:
+    """
+    Thread-safe store of EidRecords with secondary indexes.
+
+    * by phase                  -> set of EIDs   (O(1) counts / membership)
+    * by (plan, plan status)    -> set of EIDs
+    * by device status          -> set of EIDs
+      (the default NONE / UNKNOWN codes are not indexed - every EID starts
+      there, so those sets would just be copies of the whole fleet)
+    * due-time heap             -> O(log n) "next EID due" with lazy deletion
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: dict[str, EidRecord] = {}
+        self._by_phase = [set() for _ in PHASES]
+        self._by_plan = [[set() for _ in PLAN_STATUSES] for _ in PLAN_NAMES]
+        self._by_device = [set() for _ in DEVICE_STATUSES]
+        self._due_heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, eid: str) -> bool:
+        return eid in self._records
+
+    # ---------------------------- writes ---------------------------- #
+
+    def add(self, eid: str, phase: str = 'PENDING') -> EidRecord:
+        with self._lock:
+            record = self._records.get(eid)
+            if record is None:
+                record = EidRecord(eid)
+                self._records[eid] = record
+                self._by_phase[0].add(eid)
+            self._set_phase(record, _PHASE_CODE[phase])
+            return record
+
+    def set_phase(self, eid: str, phase: str) -> None:
+        with self._lock:
+            self._set_phase(self._records[eid], _PHASE_CODE[phase])
+
+    def set_plan_status(self, eid: str, plan_name: str, status: str, iccid: str = None) -> None:
+        plan_idx = _PLAN_INDEX[plan_name]
+        new_code = _PLAN_STATUS_CODE[status]
+        shift = plan_idx * _PLAN_BITS
+        with self._lock:
+            record = self._records[eid]
+            old_code = (record.plans >> shift) & _PLAN_MASK
+            if old_code != new_code:
+                if old_code:
+                    self._by_plan[plan_idx][old_code].discard(eid)
+                if new_code:
+                    self._by_plan[plan_idx][new_code].add(eid)
+                record.plans = (record.plans & ~(_PLAN_MASK << shift)) | (new_code << shift)
+            if iccid is not None:
+                if record.iccids is None:
+                    record.iccids = [None] * len(PLAN_NAMES)
+                record.iccids[plan_idx] = iccid
+
+    def set_device_status(self, eid: str, device_status: str) -> None:
+        new_code = _DEVICE_CODE.get(device_status, _DEVICE_CODE['OFFLINE'])
+        with self._lock:
+            record = self._records[eid]
+            if record.device != new_code:
+                if record.device:
+                    self._by_device[record.device].discard(eid)
+                if new_code:
+                    self._by_device[new_code].add(eid)
+                record.device = new_code
+
+    def set_outstanding(self, eid: str, request_id: str | None, next_due: float | None = None) -> None:
+        """Record the requestId an EID is waiting on and when it should next be checked."""
+        with self._lock:
+            record = self._records[eid]
+            record.request_id = request_id
+            if next_due == record.next_due:
+                return
+            record.next_due = next_due
+            if next_due is not None:
+                heapq.heappush(self._due_heap, (next_due, eid))
+                if len(self._due_heap) > 2 * len(self._records):
+                    self._compact_due()
+
+    def apply(self, eid: str, update: dict) -> None:
+        """Apply a state update as emitted by a worker (see TealUS.report_state)."""
+        if eid not in self._records:
+            self.add(eid)
+        if update.get('phase'):
+            self.set_phase(eid, update['phase'])
+        if update.get('device_status'):
+            self.set_device_status(eid, update['device_status'])
+        if update.get('plan') and update.get('plan_status'):
+            self.set_plan_status(eid, update['plan'], update['plan_status'], update.get('iccid'))
+        if 'request_id' in update:
+            self.set_outstanding(eid, update['request_id'], update.get('next_due'))
+
+    # ---------------------------- reads ----------------------------- #
+
+    def get(self, eid: str) -> EidRecord | None:
+        return self._records.get(eid)
+
+    def count(self, phase: str) -> int:
+        return len(self._by_phase[_PHASE_CODE[phase]])
+
+    def in_phase(self, phase: str) -> frozenset:
+        with self._lock:
+            return frozenset(self._by_phase[_PHASE_CODE[phase]])
+
+    def with_plan_status(self, plan_name: str, status: str) -> frozenset:
+        """e.g. with_plan_status('Verizon', 'PENDING') -> EIDs waiting on Verizon assignment."""
+        plan_idx = _PLAN_INDEX[plan_name]
+        code = _PLAN_STATUS_CODE[status]
+        with self._lock:
+            if code == 0:
+                shift = plan_idx * _PLAN_BITS
+                return frozenset(r.eid for r in self._records.values() if not (r.plans >> shift) & _PLAN_MASK)
+            return frozenset(self._by_plan[plan_idx][code])
+
+    def with_device_status(self, device_status: str) -> frozenset:
+        code = _DEVICE_CODE[device_status]
+        with self._lock:
+            if code == 0:
+                return frozenset(r.eid for r in self._records.values() if not r.device)
+            return frozenset(self._by_device[code])
+
+    def offline(self) -> frozenset:
+        return self.with_device_status('OFFLINE')
+
+    def progress(self) -> dict:
+        """Count of EIDs per phase."""
+        with self._lock:
+            return {name: len(self._by_phase[code]) for code, name in enumerate(PHASES)}
+
+    def peek_due(self) -> tuple[float, str] | None:
+        """Earliest (next_due, eid) still outstanding, or None."""
+        with self._lock:
+            self._drop_stale()
+            return self._due_heap[0] if self._due_heap else None
+
+    def pop_due(self, now: float) -> list[str]:
+        """Remove and return every EID whose next_due <= now."""
+        due = []
+        with self._lock:
+            while True:
+                self._drop_stale()
+                if not self._due_heap or self._due_heap[0][0] > now:
+                    break
+                _, eid = heapq.heappop(self._due_heap)
+                self._records[eid].next_due = None
+                due.append(eid)
+        return due
+
+    # --------------------------- internal --------------------------- #
+
+    def _set_phase(self, record: EidRecord, code: int) -> None:
+        if record.phase != code:
+            self._by_phase[record.phase].discard(record.eid)
+            self._by_phase[code].add(record.eid)
+            record.phase = code
+
+    def _compact_due(self) -> None:
+        # superseded entries are only popped lazily; with nobody popping, rebuild from the live values
+        self._due_heap = [(r.next_due, r.eid) for r in self._records.values() if r.next_due is not None]
+        heapq.heapify(self._due_heap)
+
+    def _drop_stale(self) -> None:
+        # heap entries are never removed in place; skip ones superseded by a later set_outstanding
+        heap = self._due_heap
+        while heap and self._records[heap[0][1]].next_due != heap[0][0]:
+            heapq.heappop(heap)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import threading
+
+import clock
+
+# ------------------------------------------------------------------- #
+#  Registry of Teal operations we have submitted but not yet seen a   #
+#  result for, keyed by (eid, operation, plan). Retries and restarted #
+#  runs re-poll a fresh pending requestId instead of resubmitting;    #
+#  a new submission is only allowed once the entry is resolved or     #
+#  older than the operation's staleness window. Entries are kept in   #
+#  memory and mirrored to INFLIGHT_DIR/<eid>.json (one worker owns    #
+#  an EID at a time, so files are never shared between writers).     #
+# ------------------------------------------------------------------- #
+
+INFLIGHT_DIR = os.environ.get(
+    "INFLIGHT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "inflight")
+)
+
+# Workflow seconds after which a pending submission may be repeated
+STALE_SECONDS = {
+    'activate': float(os.environ.get("INFLIGHT_STALE_ACTIVATE", "900")),
+    'assign-plan': float(os.environ.get("INFLIGHT_STALE_ASSIGN_PLAN", "900")),
+    # info results are snapshots; never reuse one older than a polling cycle
+    'info': float(os.environ.get("INFLIGHT_STALE_INFO", "60")),
+}
+
+
+class InflightRegistry:
+    def __init__(self, directory: str | None = INFLIGHT_DIR, stale_seconds: dict = None):
+        self.directory = directory or None
+        self.stale_seconds = stale_seconds or STALE_SECONDS
+        self._lock = threading.Lock()
+        self._by_eid: dict[str, dict] = {}
+        self._eid_of: dict[str, str] = {}  # requestId -> eid
+
+    def pending(self, eid: str, operation: str, plan: str = '') -> str | None:
+        """requestId of a non-stale unresolved submission, or None."""
+        with self._lock:
+            entries = self._load(eid)
+            entry = entries.get(f"{operation}|{plan}")
+            if entry is None:
+                return None
+            if self._is_stale(operation, entry):
+                del entries[f"{operation}|{plan}"]
+                self._eid_of.pop(entry['request_id'], None)
+                self._save(eid, entries)
+                return None
+            self._eid_of[entry['request_id']] = eid
+            return entry['request_id']
+
+    def record(self, eid: str, operation: str, request_id: str, plan: str = '') -> None:
+        """Remember a submission before it is sent, so a lost response still leaves a trace."""
+        with self._lock:
+            entries = self._load(eid)
+            old = entries.get(f"{operation}|{plan}")
+            if old:
+                self._eid_of.pop(old['request_id'], None)
+            entries[f"{operation}|{plan}"] = {'request_id': request_id, 'submitted_at': time.time()}
+            self._eid_of[request_id] = eid
+            self._save(eid, entries)
+
+    def resolve(self, request_id: str) -> None:
+        """Forget a submission once its result is known (or it never reached Teal)."""
+        with self._lock:
+            eid = self._eid_of.pop(request_id, None)
+            if eid is None:
+                return
+            entries = self._load(eid)
+            for key, entry in list(entries.items()):
+                if entry['request_id'] == request_id:
+                    del entries[key]
+            self._save(eid, entries)
+
+    def clear(self, eid: str) -> None:
+        """Forget every submission of an EID (its workflow has finished)."""
+        with self._lock:
+            for entry in self._load(eid).values():
+                self._eid_of.pop(entry['request_id'], None)
+            self._by_eid[eid] = {}
+            self._save(eid, {})
+
+    def prune(self) -> int:
+        """Drop stale entries of every EID on disk (files of EIDs never run again); returns files removed."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                with self._lock:
+                    eid = name[:-len('.json')]
+                    self._by_eid.pop(eid, None)
+                    if not self._load(eid):
+                        removed += 1
+        return removed
+
+    def _is_stale(self, operation: str, entry: dict) -> bool:
+        max_age = self.stale_seconds.get(operation, 0) * clock.get_clock().scale
+        return time.time() - entry['submitted_at'] > max_age
+
+    # --------------------------- storage ---------------------------- #
+
+    def _load(self, eid: str) -> dict:
+        entries = self._by_eid.get(eid)
+        if entries is None:
+            entries = {}
+            if self.directory:
+                try:
+                    with open(os.path.join(self.directory, f"{eid}.json"), encoding='utf-8') as fh:
+                        entries = json.load(fh)
+                except (OSError, ValueError):
+                    entries = {}
+                # drop what a previous run left behind long enough ago to resubmit anyway
+                fresh = {key: entry for key, entry in entries.items()
+                         if not self._is_stale(key.partition('|')[0], entry)}
+                if len(fresh) != len(entries):
+                    entries = fresh
+                    self._save(eid, entries)
+            self._by_eid[eid] = entries
+        return entries
+
+    def _save(self, eid: str, entries: dict) -> None:
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{eid}.json")
+        if not entries:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(entries, fh)
+        os.replace(tmp, path)
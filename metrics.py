@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import atexit
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ------------------------------------------------------------------- #
+#  Minimal in-process Prometheus-style metrics.                       #
+#  Workers (TealUS) record into the module-level REGISTRY and, when   #
+#  METRICS_DIR is set, dump a JSON snapshot there periodically and at #
+#  exit. The runner merges those snapshots with its own registry and  #
+#  serves them on METRICS_PORT and/or writes METRICS_TEXTFILE.        #
+# ------------------------------------------------------------------- #
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "15"))
+
+# Buckets sized for Teal calls (sub-second) up to whole-plan phases (tens of minutes)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400, 3600)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'help': self.help,
+                'values': [[list(map(list, key)), self._copy(value)] for key, value in self._values.items()],
+            }
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, values: list) -> None:
+        with self._lock:
+            for key, value in values:
+                key = tuple(map(tuple, key))
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(key)} {value}' for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [per-bucket counts (non-cumulative), +Inf count, sum]
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            else:
+                entry[1] += 1
+            entry[2] += value
+
+    def observe_since(self, started: float, **labels) -> None:
+        """Observe the time elapsed since a time.perf_counter() reading."""
+        self.observe(time.perf_counter() - started, **labels)
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data['buckets'] = list(self.buckets)
+        return data
+
+    def merge(self, values: list) -> None:
+        with self._lock:
+            for key, (counts, overflow, total) in values:
+                key = tuple(map(tuple, key))
+                entry = self._values.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += overflow
+                entry[2] += total
+
+    def render(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, overflow, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(key, (("le", bound),))} {cumulative}')
+                cumulative += overflow
+                lines.append(f'{self.name}_bucket{_format_labels(key, (("le", "+Inf"),))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _get(self, cls, name: str, help_text: str, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshot: dict) -> None:
+        """Add another process' snapshot into this registry (gauges are summed too)."""
+        kinds = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+        for name, data in snapshot.items():
+            kwargs = {'buckets': tuple(data['buckets'])} if 'buckets' in data else {}
+            self._get(kinds[data['kind']], name, data['help'], **kwargs).merge(data['values'])
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Metrics recorded by every TealUS worker
+API_SECONDS = REGISTRY.histogram('teal_api_request_seconds', 'Latency of Teal API calls by endpoint')
+API_RESPONSES = REGISTRY.counter('teal_api_responses_total', 'Teal API responses by endpoint and HTTP code')
+PHASE_SECONDS = REGISTRY.histogram('teal_phase_seconds', 'Time spent in each workflow phase')
+RETRIES = REGISTRY.counter('teal_retries_total', 'Workflow retries by reason')
+DEDUPLICATED = REGISTRY.counter('teal_deduplicated_submissions_total',
+                                'Submissions replaced by re-polling an in-flight operation')
+
+
+# ---------------------------- worker side ---------------------------- #
+
+def write_snapshot(directory: str = None) -> None:
+    """Atomically dump this process' registry into <directory>/worker_<pid>.json."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return
+    path = os.path.join(directory, f'worker_{os.getpid()}.json')
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(REGISTRY.snapshot(), fh)
+    os.replace(tmp, path)
+
+
+def start_worker_flusher() -> None:
+    """Flush snapshots every METRICS_FLUSH_SECONDS and at exit; no-op without METRICS_DIR."""
+    if not METRICS_DIR:
+        return
+
+    def loop():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=loop, daemon=True).start()
+    atexit.register(write_snapshot)
+
+
+# ---------------------------- runner side ---------------------------- #
+
+class Collector:
+    """Merges the runner's registry, finished workers and live worker snapshots."""
+
+    def __init__(self, registry: Registry, directory: str):
+        self.registry = registry
+        self.directory = directory
+        self.finished = Registry()
+        self._lock = threading.Lock()
+
+    def absorb(self, pid: int) -> None:
+        """Fold a finished worker's final snapshot into the totals and remove its file."""
+        path = os.path.join(self.directory, f'worker_{pid}.json')
+        # render() scans the directory under the same lock, so a scrape sees the
+        # worker either as a live file or in `finished`, never both
+        with self._lock:
+            try:
+                with open(path, encoding='utf-8') as fh:
+                    snapshot = json.load(fh)
+                os.remove(path)
+            except (OSError, ValueError):
+                return
+            self.finished.merge(snapshot)
+
+    def render(self) -> str:
+        merged = Registry()
+        merged.merge(self.registry.snapshot())
+        with self._lock:
+            merged.merge(self.finished.snapshot())
+            for name in os.listdir(self.directory):
+                if name.startswith('worker_') and name.endswith('.json'):
+                    try:
+                        with open(os.path.join(self.directory, name), encoding='utf-8') as fh:
+                            merged.merge(json.load(fh))
+                    except (OSError, ValueError):
+                        continue  # worker is mid-write or already absorbed
+        return merged.render()
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = collector.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def write_textfile(self, path: str) -> None:
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(self.render())
+        os.replace(tmp, path)
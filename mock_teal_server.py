@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+import json
+import random
+import argparse
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# ------------------------------------------------------------------- #
+#  Local stand-in for integrationapi.teal.global                      #
+#  Serves /esims/activate, /esims/info, /esims/assign-plan and        #
+#  /operation-result with configurable latency and fault injection.   #
+#  Point TealUS at it with TEAL_BASE_URL=http://127.0.0.1:<port>/api/v1 #
+# ------------------------------------------------------------------- #
+
+API_PREFIX = '/api/v1'
+
+
+@dataclass
+class MockConfig:
+    # workflow-time delays are multiplied by time_scale (same meaning as TEAL_TIME_SCALE)
+    time_scale: float = 1.0
+    # HTTP latency per call: lognormal with this median (ms) and sigma, never scaled
+    latency_median_ms: float = 20.0
+    latency_sigma: float = 0.5
+    # seconds (workflow time) until an operation result stops returning 102
+    operation_delay: float = 20.0
+    # seconds after activation until the eSIM reports active
+    activation_delay: float = 60.0
+    # seconds after assign-plan until planChangeStatus leaves IN_PROGRESS
+    plan_change_delay: float = 200.0
+    # fault injection rates (0..1)
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    rate_102: float = 0.0  # extra 102s on operation-result after the result is ready
+    offline_rate: float = 0.0  # share of devices that start OFFLINE
+    offline_duration: float = 300.0
+    plan_failure_rate: float = 0.0
+    seed: int | None = None
+
+
+@dataclass
+class Device:
+    eid: str
+    online_at: float = 0.0
+    active_at: float | None = None
+    plans: dict = field(default_factory=dict)  # planUuid -> active
+    last_plan: str | None = None
+    plan_change_status: str | None = None
+    plan_change_done_at: float = 0.0
+    plan_change_outcome: str = 'SUCCESS'
+    iccid: str = ''
+
+
+class MockTeal:
+    """In-memory Teal model shared by all request handler threads."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.devices: dict[str, Device] = {}
+        self.operations: dict[str, tuple] = {}  # requestId -> (ready_at, result builder)
+        self.calls = Counter()
+        self.statuses = Counter()
+
+    def scaled(self, seconds: float) -> float:
+        return seconds * self.config.time_scale
+
+    def device(self, eid: str) -> Device:
+        dev = self.devices.get(eid)
+        if dev is None:
+            dev = Device(eid=eid, iccid=f"8901{self.rng.randrange(10 ** 15):015d}")
+            if self.rng.random() < self.config.offline_rate:
+                dev.online_at = time.time() + self.scaled(self.config.offline_duration)
+            self.devices[eid] = dev
+        return dev
+
+    def reset(self) -> None:
+        with self.lock:
+            self.devices.clear()
+            self.operations.clear()
+            self.calls.clear()
+            self.statuses.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'statuses': {str(k): v for k, v in self.statuses.items()},
+                'total_calls': sum(self.calls.values()),
+                'devices': len(self.devices),
+            }
+
+    # ------------------------- operations ------------------------- #
+
+    def _register(self, request_id: str, build) -> None:
+        self.operations[request_id] = (time.time() + self.scaled(self.config.operation_delay), build)
+
+    def activate(self, request_id: str, entries: list) -> dict:
+        now = time.time()
+        for eid in entries:
+            dev = self.device(eid)
+            if dev.active_at is None:
+                dev.active_at = now + self.scaled(self.config.activation_delay)
+        self._register(request_id, lambda: {'success': True, 'requestId': request_id})
+        return {'success': True, 'requestId': request_id}
+
+    def info(self, request_id: str, eid: str) -> dict:
+        dev = self.device(eid)
+        self._register(request_id, lambda: {'success': True, 'entries': [self._info_entry(dev)]})
+        return {'success': True, 'requestId': request_id}
+
+    def assign_plan(self, request_id: str, entries: list) -> dict:
+        now = time.time()
+        for entry in entries:
+            dev = self.device(entry['eid'])
+            dev.last_plan = entry['planUuid']
+            dev.plan_change_status = 'IN_PROGRESS'
+            dev.plan_change_done_at = now + self.scaled(self.config.plan_change_delay)
+            dev.plan_change_outcome = ('FAILURE' if self.rng.random() < self.config.plan_failure_rate
+                                       else 'SUCCESS')
+        self._register(request_id, lambda: {'success': True, 'requestId': request_id})
+        return {'success': True, 'requestId': request_id}
+
+    def operation_result(self, request_id: str) -> tuple[int, dict | None]:
+        op = self.operations.get(request_id)
+        if op is None:
+            return 404, {'success': False, 'message': 'Unknown requestId'}
+        ready_at, build = op
+        if time.time() < ready_at or self.rng.random() < self.config.rate_102:
+            return 102, None
+        return 200, build()
+
+    def _info_entry(self, dev: Device) -> dict:
+        now = time.time()
+        if dev.plan_change_status == 'IN_PROGRESS' and now >= dev.plan_change_done_at:
+            dev.plan_change_status = dev.plan_change_outcome
+            if dev.plan_change_outcome == 'SUCCESS':
+                for uuid_ in dev.plans:
+                    dev.plans[uuid_] = False
+                dev.plans[dev.last_plan] = True
+        return {
+            'eid': dev.eid,
+            'iccid': dev.iccid,
+            'active': dev.active_at is not None and now >= dev.active_at,
+            'deviceStatus': 'ONLINE' if now >= dev.online_at else 'OFFLINE',
+            'planChangeStatus': dev.plan_change_status,
+            'connectionProfileEntries': [
+                {'planUuid': plan_uuid, 'active': active, 'fallbackProfile': False}
+                for plan_uuid, active in dev.plans.items()
+            ],
+            'lastConnectedNetwork': {},
+        }
+
+
+def make_handler(teal: MockTeal):
+    config = teal.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass  # keep benchmark output clean
+
+        def _reply(self, status: int, body: dict | None = None) -> None:
+            payload = json.dumps(body).encode() if body is not None else b''
+            self.send_response(status)
+            if status >= 200:
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            if payload:
+                self.wfile.write(payload)
+            with teal.lock:
+                teal.statuses[status] += 1
+
+        def _dispatch(self, method: str) -> None:
+            parsed = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            endpoint = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX) else parsed.path
+
+            body = None
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = json.loads(self.rfile.read(length))
+
+            if endpoint == '/_stats':
+                return self._reply(200, teal.stats())
+            if endpoint == '/_reset':
+                teal.reset()
+                return self._reply(200, {'success': True})
+
+            delay = teal.rng.lognormvariate(0, config.latency_sigma) * config.latency_median_ms / 1000
+            time.sleep(delay)
+
+            with teal.lock:
+                teal.calls[endpoint] += 1
+                roll = teal.rng.random()
+            if roll < config.rate_429:
+                return self._reply(429, {'success': False, 'message': 'Too Many Requests'})
+            if roll < config.rate_429 + config.rate_5xx:
+                return self._reply(503, {'success': False, 'message': 'Service Unavailable'})
+
+            request_id = params.get('requestId') or uuid.uuid4().hex
+            with teal.lock:
+                status, result = self._route(method, endpoint, params, body, request_id)
+            return self._reply(status, result)
+
+        def _route(self, method, endpoint, params, body, request_id) -> tuple[int, dict | None]:
+            if method == 'POST' and endpoint == '/esims/activate':
+                return 200, teal.activate(request_id, body['entries'])
+            if method == 'POST' and endpoint == '/esims/assign-plan':
+                return 200, teal.assign_plan(request_id, body['entries'])
+            if method == 'GET' and endpoint == '/esims/info':
+                return 200, teal.info(request_id, params['eid'])
+            if method == 'GET' and endpoint == '/operation-result':
+                return teal.operation_result(request_id)
+            return 404, {'success': False, 'message': f'No route for {method} {endpoint}'}
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+    return Handler
+
+
+def start_server(config: MockConfig, host: str = '127.0.0.1', port: int = 0):
+    """Start the mock in a daemon thread; returns (server, teal). Port 0 picks a free one."""
+    teal = MockTeal(config)
+    server = ThreadingHTTPServer((host, port), make_handler(teal))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, teal
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Multiplier for workflow-time delays')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Median HTTP latency in ms')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Lognormal sigma of HTTP latency')
+    parser.add_argument('--operation-delay', type=float, default=20.0)
+    parser.add_argument('--activation-delay', type=float, default=60.0)
+    parser.add_argument('--plan-change-delay', type=float, default=200.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-5xx', type=float, default=0.0)
+    parser.add_argument('--rate-102', type=float, default=0.0)
+    parser.add_argument('--offline-rate', type=float, default=0.0)
+    parser.add_argument('--offline-duration', type=float, default=300.0)
+    parser.add_argument('--plan-failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        time_scale=args.time_scale,
+        latency_median_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        operation_delay=args.operation_delay,
+        activation_delay=args.activation_delay,
+        plan_change_delay=args.plan_change_delay,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rate_102=args.rate_102,
+        offline_rate=args.offline_rate,
+        offline_duration=args.offline_duration,
+        plan_failure_rate=args.plan_failure_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local mock of the Teal integration API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, _ = start_server(config_from_args(args), args.host, args.port)
+    print(f"Mock Teal API listening on http://{args.host}:{server.server_port}{API_PREFIX}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
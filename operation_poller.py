@@ -0,0 +1,167 @@
+import os
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import clock
+import tracing
+
+# ------------------------------------------------------------------- #
+#  Central /operation-result poller.                                  #
+#  Outstanding requestIds sit in a due-time heap; one dispatcher      #
+#  thread hands due entries to a small fixed pool, so polling load is #
+#  bounded no matter how many operations are waiting and a waiting    #
+#  caller holds only a Future. A 102 (fetch returns None) puts the    #
+#  entry back on the heap with back-off instead of surfacing None.    #
+#  ParallelProcessor_US runs the one poller of a batch; its workers   #
+#  hand their waits over (see TealUS.await_operation).                #
+# ------------------------------------------------------------------- #
+
+POLL_CONCURRENCY = int(os.environ.get("POLL_CONCURRENCY", "8"))
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", "10"))
+POLL_MAX_INTERVAL = float(os.environ.get("POLL_MAX_INTERVAL", "60"))
+POLL_TIMEOUT = float(os.environ.get("POLL_TIMEOUT", "120"))
+
+
+class _Pending:
+    __slots__ = ('request_id', 'future', 'deadline', 'interval', 'attempts', 'parent')
+
+    def __init__(self, request_id: str, future: Future, deadline: float, interval: float, parent=None):
+        self.request_id = request_id
+        self.future = future
+        self.deadline = deadline
+        self.interval = interval
+        self.attempts = 0
+        self.parent = parent
+
+
+class OperationPoller:
+    """
+    Multiplexes many outstanding operations over `concurrency` polling threads.
+    `fetch(request_id)` returns the operation result, or None while Teal
+    still answers 102; `on_pending(request_id)` is called for every 102.
+    All delays are in workflow seconds (see clock.py).
+    """
+
+    def __init__(self, fetch, concurrency: int = POLL_CONCURRENCY, interval: float = POLL_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL, timeout: float = POLL_TIMEOUT, backoff: float = 1.5,
+                 on_pending=None):
+        self.fetch = fetch
+        self.on_pending = on_pending
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.backoff = backoff
+        self._heap: list[tuple[float, int, _Pending]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = None
+        self._dispatcher = None
+        self._closed = False
+
+    def submit(self, request_id: str, delay: float = 0, timeout: float = None, callback=None,
+               parent=None) -> Future:
+        """
+        Schedule `request_id` to be polled after `delay` seconds. The Future
+        resolves with the operation result, with None if it is still
+        processing after `timeout` seconds, or with the fetch exception.
+        Poll spans are parented to `parent` (default: the caller's current span).
+        """
+        future = Future()
+        if callback:
+            future.add_done_callback(callback)
+        deadline = clock.due_in(delay + (self.timeout if timeout is None else timeout))
+        parent = parent or tracing.TRACER.current()
+        self._schedule(_Pending(request_id, future, deadline, self.interval, parent), clock.due_in(delay))
+        return future
+
+    def wait(self, request_id: str, delay: float = 0, timeout: float = None):
+        """
+        Blocking helper with the same back-off and deadline as submit(), but
+        polled on the calling thread - no dispatcher or pool is started for
+        a caller that only ever has one operation outstanding.
+        """
+        deadline = clock.due_in(delay + (self.timeout if timeout is None else timeout))
+        interval = self.interval
+        clock.sleep(delay)
+        while True:
+            result = self.fetch(request_id)
+            if result is not None:
+                return result
+            if self.on_pending:
+                self.on_pending(request_id)
+            remaining = deadline - clock.now()
+            if remaining <= 0:
+                return None
+            clock.sleep(min(interval, remaining / clock.get_clock().scale))
+            interval = min(interval * self.backoff, self.max_interval)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._dispatcher:
+            self._dispatcher.join()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+    # --------------------------- internal --------------------------- #
+
+    def _schedule(self, entry: _Pending, due: float) -> None:
+        with self._cond:
+            if self._closed:
+                entry.future.set_exception(RuntimeError("Operation poller is closed."))
+                return
+            if self._dispatcher is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='op-poll')
+                self._dispatcher = threading.Thread(target=self._dispatch, name='op-poll-dispatch', daemon=True)
+                self._dispatcher.start()
+            heapq.heappush(self._heap, (due, next(self._seq), entry))
+            if self._heap[0][2] is entry:
+                self._cond.notify()
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._heap:
+                        wait = self._heap[0][0] - clock.now()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    for _, _, entry in self._heap:
+                        entry.future.cancel()
+                    self._heap.clear()
+                    return
+                _, _, entry = heapq.heappop(self._heap)
+            self._pool.submit(self._poll, entry)
+
+    def _poll(self, entry: _Pending) -> None:
+        entry.attempts += 1
+        try:
+            with tracing.TRACER.attached(entry.parent):
+                result = self.fetch(entry.request_id)
+        except Exception as exc:
+            entry.future.set_exception(exc)
+            return
+        if result is not None:
+            entry.future.set_result(result)
+            return
+        # still processing (102): back off and try again unless we are out of time
+        if self.on_pending:
+            self.on_pending(entry.request_id)
+        if clock.now() >= entry.deadline:
+            entry.future.set_result(None)
+            return
+        next_due = min(clock.due_in(entry.interval), entry.deadline)
+        entry.interval = min(entry.interval * self.backoff, self.max_interval)
+        self._schedule(entry, next_due)
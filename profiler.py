@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import time
+import atexit
+import argparse
+import threading
+from collections import Counter
+
+# ------------------------------------------------------------------- #
+#  Low-overhead sampling profiler for the runner and its workers.     #
+#  With PROFILE_DIR set, every process samples all of its threads'    #
+#  stacks every PROFILE_INTERVAL seconds and writes                   #
+#    <role>_<pid>.wall.collapsed  - one count per sample (wall clock) #
+#    <role>_<pid>.cpu.collapsed   - weighted by thread CPU µs used    #
+#  in collapsed-stack format; merge() folds a batch's files into one  #
+#  pair of flamegraph inputs (flamegraph.pl, speedscope, ...).        #
+# ------------------------------------------------------------------- #
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.01"))
+
+
+def _thread_cpu_seconds(ident: int) -> float | None:
+    """CPU time used by a thread so far (None where the platform can't tell)."""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler(threading.Thread):
+    def __init__(self, role: str, directory: str, interval: float = PROFILE_INTERVAL):
+        super().__init__(name='sampling-profiler', daemon=True)
+        self.role = role
+        self.directory = directory
+        self.interval = interval
+        self.wall = Counter()
+        self.cpu = Counter()
+        self._cpu_seen: dict[int, float] = {}
+        self._stop_event = threading.Event()
+        self._labels: dict = {}
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self._collapse(names.get(ident, 'thread'), frame)
+                self.wall[stack] += 1
+
+                cpu = _thread_cpu_seconds(ident)
+                if cpu is not None:
+                    used = cpu - self._cpu_seen.get(ident, cpu)
+                    self._cpu_seen[ident] = cpu
+                    if used > 0:
+                        self.cpu[stack] += int(used * 1e6)
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _frame_label(code)
+            parts.append(label)
+            frame = frame.f_back
+        parts.append(thread_name)
+        parts.append(self.role)
+        return ';'.join(reversed(parts))
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.write()
+
+    def write(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{self.role}_{os.getpid()}")
+        for suffix, counts in (('wall', self.wall), ('cpu', self.cpu)):
+            with open(f"{base}.{suffix}.collapsed", 'w', encoding='utf-8') as fh:
+                for stack, count in counts.items():
+                    fh.write(f"{stack} {count}\n")
+
+
+def start_from_env(role: str) -> SamplingProfiler | None:
+    """Start profiling this process if PROFILE_DIR is set; results are written at exit."""
+    if not PROFILE_DIR:
+        return None
+    profiler = SamplingProfiler(role, PROFILE_DIR)
+    profiler.start()
+    atexit.register(profiler.stop)
+    return profiler
+
+
+def merge(directory: str, out_prefix: str) -> dict[str, str]:
+    """Sum every per-process profile in `directory` into <out_prefix>.{wall,cpu}.collapsed."""
+    outputs = {}
+    for suffix in ('wall', 'cpu'):
+        totals = Counter()
+        for path in glob.glob(os.path.join(directory, f"*_*.{suffix}.collapsed")):
+            with open(path, encoding='utf-8') as fh:
+                for line in fh:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        totals[stack] += int(count)
+        out_path = f"{out_prefix}.{suffix}.collapsed"
+        with open(out_path, 'w', encoding='utf-8') as fh:
+            for stack, count in totals.most_common():
+                fh.write(f"{stack} {count}\n")
+        outputs[suffix] = out_path
+    return outputs
+
+
+def top_frames(collapsed_path: str, limit: int = 15) -> list[tuple[str, int]]:
+    """Self (leaf) totals per frame of a collapsed profile."""
+    leaves = Counter()
+    with open(collapsed_path, encoding='utf-8') as fh:
+        for line in fh:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            leaves[stack.rsplit(';', 1)[-1]] += int(count)
+    return leaves.most_common(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge per-process sampling profiles of a batch')
+    parser.add_argument('directory', help='PROFILE_DIR the batch was run with')
+    parser.add_argument('--output', help='Output prefix (default: <directory>/batch)')
+    args = parser.parse_args()
+
+    outputs = merge(args.directory, args.output or os.path.join(args.directory, 'batch'))
+    for suffix, path in outputs.items():
+        print(f"{suffix}: {path}")
+        for frame, count in top_frames(path):
+            print(f"    {count:>10}  {frame}")
+
+
+if __name__ == '__main__':
+    main()
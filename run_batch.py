@@ -4,13 +4,20 @@ import os
 import sys
 import subprocess
 import argparse
+import datetime
 from supabase import create_client, Client
 
+import profiler
+
 def main():
     parser = argparse.ArgumentParser(description='Run eSIM batch processing')
     parser.add_argument('batch_id', help='Batch ID to process')
     parser.add_argument('--service-key', help='Supabase service role key', 
                        default=os.environ.get('SUPABASE_SERVICE_ROLE_KEY'))
+    parser.add_argument('--no-triage', action='store_true',
+                       help='Run the full workflow for every EID without the pre-flight triage')
+    parser.add_argument('--profile', action='store_true',
+                       help='Sample-profile the runner and every worker; merged output in profiles/<batch_id>/<run>/')
     
     args = parser.parse_args()
     
@@ -22,6 +29,14 @@ def main():
     env = os.environ.copy()
     env['BATCH_ID'] = args.batch_id
     env['SUPABASE_SERVICE_ROLE_KEY'] = args.service_key
+    if args.no_triage:
+        env['TRIAGE'] = '0'
+    profile_dir = None
+    if args.profile:
+        # one directory per run so a re-run never merges the previous run's profiles
+        run = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        profile_dir = os.path.abspath(os.path.join('profiles', args.batch_id, run))
+        env['PROFILE_DIR'] = profile_dir
     
     # Run the parallel processor
     try:
@@ -30,6 +45,10 @@ def main():
     except subprocess.CalledProcessError as e:
         print(f"Batch {args.batch_id} processing failed with return code {e.returncode}")
         sys.exit(1)
+    finally:
+        if profile_dir and os.path.isdir(profile_dir):
+            outputs = profiler.merge(profile_dir, os.path.join(profile_dir, 'batch'))
+            print(f"Profiles: {outputs['wall']} (wall clock), {outputs['cpu']} (CPU)")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,129 @@
+import os
+import sys
+import gzip
+import json
+import queue
+import atexit
+import shutil
+import time
+import datetime
+import threading
+
+# ------------------------------------------------------------------- #
+#  Asynchronous run-log writer.                                       #
+#  Producers only enqueue; one writer thread batches lines to the     #
+#  console and the run log, flushes every `flush_interval` seconds or #
+#  immediately for ERROR lines, rotates the log by size (gzipping old #
+#  segments) and can mirror every record to a JSON-lines file, which  #
+#  is rotated in step with the log.                                   #
+# ------------------------------------------------------------------- #
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+_STOP = object()
+
+
+class RunLogWriter:
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024, flush_interval: float = 1.0,
+                 jsonl_path: str | None = None, console=sys.stdout, batch_size: int = 512):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.jsonl_path = jsonl_path
+        self.console = console
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self._segment = 0
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='run-log-writer', daemon=True)
+        self._thread.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    def write(self, line: str, level: str = 'INFO', eid: str = '', message: str = None) -> None:
+        """Queue one line; never blocks on I/O."""
+        self._queue.put((line, level, eid, message if message is not None else line,
+                         datetime.datetime.utcnow().isoformat()))
+
+    def close(self) -> None:
+        """Write out everything queued and stop the writer thread (idempotent)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    # --------------------------- writer --------------------------- #
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                if self._dirty:
+                    self._flush()
+                continue
+            # drain whatever else is already queued so one write covers many lines
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopping = True
+            elif _STOP in batch:
+                batch.remove(_STOP)
+                stopping = True
+            if batch:
+                self._write_batch(batch)
+        self._flush()
+        self._file.close()
+        if self._jsonl:
+            self._jsonl.close()
+
+    def _write_batch(self, batch: list) -> None:
+        text = ''.join(record[0] + '\n' for record in batch)
+        self.console.write(text)
+        self._file.write(text)
+        if self._jsonl:
+            self._jsonl.write(''.join(
+                json.dumps({'timestamp': ts, 'level': level, 'eid': eid or None, 'message': message}) + '\n'
+                for _, level, eid, message, ts in batch
+            ))
+        self._dirty = True
+        urgent = any(LEVELS.get(record[1], 20) >= LEVELS['ERROR'] for record in batch)
+        if urgent or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush()
+        if self._file.tell() >= self.max_bytes or (self._jsonl and self._jsonl.tell() >= self.max_bytes):
+            self._rotate()
+
+    def _flush(self) -> None:
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.console.flush()
+        self._file.flush()
+        if self._jsonl:
+            self._jsonl.flush()
+
+    def _rotate(self) -> None:
+        """Start new segments of the log and the JSON-lines mirror, gzipping the old ones."""
+        self._segment += 1
+        self._file.close()
+        self._file = self._compress(self.path)
+        if self._jsonl:
+            self._jsonl.close()
+            self._jsonl = self._compress(self.jsonl_path)
+
+    def _compress(self, path: str):
+        segment = f'{path}.{self._segment}'
+        os.replace(path, segment)
+        fresh = open(path, 'a', encoding='utf-8')
+        with open(segment, 'rb') as src, gzip.open(segment + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(segment)
+        return fresh
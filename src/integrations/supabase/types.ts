@@ -118,6 +118,8 @@ export type Database = {
           tmo_plan_request_id: string | null
           tmo_status: string | null
           tmo_timestamp: string | null
+          triage_category: string | null
+          triage_missing_plans: string | null
           updated_at: string
           verizon_iccid: string | null
           verizon_plan_request_id: string | null
@@ -146,6 +148,8 @@ export type Database = {
           tmo_plan_request_id?: string | null
           tmo_status?: string | null
           tmo_timestamp?: string | null
+          triage_category?: string | null
+          triage_missing_plans?: string | null
           updated_at?: string
           verizon_iccid?: string | null
           verizon_plan_request_id?: string | null
@@ -174,6 +178,8 @@ export type Database = {
           tmo_plan_request_id?: string | null
           tmo_status?: string | null
           tmo_timestamp?: string | null
+          triage_category?: string | null
+          triage_missing_plans?: string | null
           updated_at?: string
           verizon_iccid?: string | null
           verizon_plan_request_id?: string | null
@@ -208,6 +214,7 @@ export type Database = {
         | "FAILED"
         | "PAUSED"
         | "STOPPED"
+        | "DEFERRED"
       log_level: "DEBUG" | "INFO" | "WARNING" | "ERROR"
     }
     CompositeTypes: {
@@ -331,6 +338,7 @@ export const Constants = {
         "FAILED",
         "PAUSED",
         "STOPPED",
+        "DEFERRED",
       ],
       log_level: ["DEBUG", "INFO", "WARNING", "ERROR"],
     },
@@ -371,6 +371,7 @@ const BatchDetails = () => {
       case 'SUCCESS': return 'bg-green-500 text-white';
       case 'FAILED': return 'bg-red-500 text-white';
       case 'PENDING': return 'bg-yellow-500 text-white';
+      case 'DEFERRED': return 'bg-orange-500 text-white';
       default: return 'bg-gray-500 text-white';
     }
   };
@@ -35,6 +35,7 @@ const Dashboard = () => {
       case 'COMPLETED': return 'bg-green-500';
       case 'FAILED': return 'bg-red-500';
       case 'PENDING': return 'bg-yellow-500';
+      case 'DEFERRED': return 'bg-orange-500';
       default: return 'bg-gray-500';
     }
   };
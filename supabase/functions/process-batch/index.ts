@@ -200,7 +200,7 @@ async function processEsim(eid: string, planUuids: any, apiKey: string, apiSecre
       batch_id: batchId,
       eid,
       activation_request_id: activationRequestId
-    });
+    }, { onConflict: 'batch_id,eid' });
 
     console.log(`Activation initiated for ${eid} with request ID: ${activationRequestId}`);
     await logToBatch(supabase, batchId, 'INFO', `Activation initiated with request ID: ${activationRequestId}`, eid);
@@ -311,7 +311,7 @@ async function processEsim(eid: string, planUuids: any, apiKey: string, apiSecre
         batch_id: batchId,
         eid,
         [`${plan.name.toLowerCase()}_plan_request_id`]: planRequestId
-      });
+      }, { onConflict: 'batch_id,eid' });
 
       await sleep(30000);
       
@@ -340,7 +340,7 @@ async function processEsim(eid: string, planUuids: any, apiKey: string, apiSecre
           [`${plan.name.toLowerCase()}_iccid`]: iccid,
           [`${plan.name.toLowerCase()}_status`]: planChangeStatus,
           [`${plan.name.toLowerCase()}_timestamp`]: new Date().toISOString()
-        });
+        }, { onConflict: 'batch_id,eid' });
         console.log(`${plan.name} plan assigned successfully to ${eid}`);
         await logToBatch(supabase, batchId, 'INFO', `${plan.name} plan assigned successfully`, eid);
       } else {
@@ -361,7 +361,7 @@ async function processEsim(eid: string, planUuids: any, apiKey: string, apiSecre
       batch_id: batchId,
       eid,
       error_message: errorMessage
-    });
+    }, { onConflict: 'batch_id,eid' });
     await supabase.rpc('increment_batch_failure', { batch_id: batchId });
   }
 }
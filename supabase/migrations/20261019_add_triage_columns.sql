@@ -0,0 +1,18 @@
+-- Outcome of the pre-flight triage run by ParallelProcessor_US (see triage.py)
+ALTER TABLE esim_results
+  ADD COLUMN IF NOT EXISTS triage_category TEXT,
+  ADD COLUMN IF NOT EXISTS triage_missing_plans TEXT;
+
+-- Upserts without a conflict target matched on id and inserted extra rows per
+-- (batch_id, eid); keep the most recently updated one before enforcing uniqueness
+DELETE FROM esim_results a
+  USING esim_results b
+  WHERE a.batch_id = b.batch_id
+    AND a.eid = b.eid
+    AND (COALESCE(a.updated_at, a.created_at), a.id::text) < (COALESCE(b.updated_at, b.created_at), b.id::text);
+
+-- Conflict target of every esim_results upsert (one row per EID and batch)
+CREATE UNIQUE INDEX IF NOT EXISTS esim_results_batch_id_eid_key ON esim_results (batch_id, eid);
+
+-- Batches whose offline (DEFERRED) EIDs were left for a later run
+ALTER TYPE batch_status ADD VALUE IF NOT EXISTS 'DEFERRED';
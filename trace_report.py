@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import glob
+import argparse
+from collections import defaultdict
+
+# ------------------------------------------------------------------- #
+#  Aggregates the span files written by tracing.py into a per-batch   #
+#  wait-vs-work breakdown, the critical path of the average EID and   #
+#  the fixed waits that cost the most.                                #
+# ------------------------------------------------------------------- #
+
+
+def category(span: dict) -> str:
+    name = span['name']
+    if span['attributes'].get('wait'):
+        return 'wait'
+    if name.startswith('teal '):
+        return 'teal_api'
+    if name.startswith('supabase '):
+        return 'supabase'
+    return 'other'
+
+
+def load_spans(paths: list[str]) -> dict[str, list[dict]]:
+    """Spans grouped by traceId (one trace per EID)."""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue  # truncated last line of a killed worker
+                if span.get('endTimeUnixNano') is None:
+                    continue
+                span['duration'] = (span['endTimeUnixNano'] - span['startTimeUnixNano']) / 1e9
+                traces[span['traceId']].append(span)
+    return traces
+
+
+def critical_path(span: dict, children: dict, out: dict) -> None:
+    """
+    Walk back from the span's end picking the latest-ending child that
+    finishes before the cursor; time not covered by such children is the
+    span's own contribution. Adds seconds per span name into `out`.
+    """
+    cursor = span['endTimeUnixNano']
+    covered = 0.0
+    for child in sorted(children.get(span['spanId'], []), key=lambda c: c['endTimeUnixNano'], reverse=True):
+        if child['endTimeUnixNano'] <= cursor:
+            critical_path(child, children, out)
+            covered += child['duration']
+            cursor = child['startTimeUnixNano']
+    out[span['name']] += max(span['duration'] - covered, 0.0)
+
+
+def self_totals(spans: list[dict], children: dict) -> dict[str, float]:
+    """
+    Seconds per category counting each span's own time (duration minus its
+    children), so a wait whose polls are traced as child calls splits into
+    wait and teal_api instead of being counted twice.
+    """
+    totals = defaultdict(float)
+    for span in spans:
+        nested = sum(child['duration'] for child in children.get(span['spanId'], []))
+        totals[category(span)] += max(span['duration'] - nested, 0.0)
+    return totals
+
+
+def summarise(traces: dict[str, list[dict]]) -> dict[str, dict]:
+    batches = defaultdict(lambda: {
+        'eids': 0,
+        'total': 0.0,
+        'categories': defaultdict(float),
+        'critical_path': defaultdict(float),
+        'waits': defaultdict(lambda: [0, 0.0]),
+    })
+    for spans in traces.values():
+        root = next((s for s in spans if s['parentSpanId'] is None and s['name'] == 'eid'), None)
+        if root is None:
+            continue
+        batch = batches[root['attributes'].get('batch_id', 'local')]
+        children = defaultdict(list)
+        for span in spans:
+            if span['parentSpanId']:
+                children[span['parentSpanId']].append(span)
+
+        batch['eids'] += 1
+        batch['total'] += root['duration']
+        for name, seconds in self_totals(spans, children).items():
+            batch['categories'][name] += seconds
+
+        critical_path(root, children, batch['critical_path'])
+
+        waits = {span['spanId'] for span in spans if span['attributes'].get('wait')}
+        for span in spans:
+            # a sleep inside an 'await operation' is part of that wait, not another one
+            if span['spanId'] in waits and span['parentSpanId'] not in waits:
+                attrs = span['attributes']
+                key = f"{attrs.get('function')}:{attrs.get('lineno')} sleep({attrs.get('seconds')})"
+                batch['waits'][key][0] += 1
+                batch['waits'][key][1] += span['duration']
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise TealUS trace spans per batch')
+    parser.add_argument('trace_dir', nargs='?', default=os.environ.get('TRACE_DIR', 'traces'),
+                        help='Directory with trace_*.jsonl files')
+    parser.add_argument('--top', type=int, default=10, help='Number of waits / path entries to show')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    paths = glob.glob(os.path.join(args.trace_dir, 'trace_*.jsonl'))
+    if not paths:
+        print(f"No trace files found in {args.trace_dir}")
+        sys.exit(1)
+
+    batches = summarise(load_spans(paths))
+
+    if args.json:
+        print(json.dumps(batches, indent=2, default=dict))
+        return
+
+    for batch_id, batch in batches.items():
+        eids = batch['eids']
+        total = batch['total'] or 1.0
+        print(f"\nBatch {batch_id}: {eids} EIDs, mean {batch['total'] / eids:.0f}s per EID")
+
+        print("  Wait vs work:")
+        for name, seconds in sorted(batch['categories'].items(), key=lambda kv: -kv[1]):
+            print(f"    {name:<10} {seconds / eids:>9.1f}s/EID  {100 * seconds / total:5.1f}%")
+
+        print("  Critical path (mean seconds per EID):")
+        path = sorted(batch['critical_path'].items(), key=lambda kv: -kv[1])[:args.top]
+        for name, seconds in path:
+            print(f"    {name:<40} {seconds / eids:>9.1f}s")
+
+        print("  Costliest waits:")
+        waits = sorted(batch['waits'].items(), key=lambda kv: -kv[1][1])[:args.top]
+        for key, (count, seconds) in waits:
+            print(f"    {key:<40} x{count:<7} {seconds / eids:>9.1f}s/EID")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import atexit
+import secrets
+import threading
+import contextlib
+
+import clock
+
+# ------------------------------------------------------------------- #
+#  Lightweight span tracing for the TealUS workflow.                  #
+#  Spans carry OTLP-style fields (traceId/spanId/parentSpanId, unix   #
+#  nano timestamps, attributes) and are appended as JSON lines to     #
+#  TRACE_DIR/trace_<pid>.jsonl. Without TRACE_DIR spans are still     #
+#  timed (the metrics use them) but never written.                    #
+#  trace_report.py turns the files into wait-vs-work breakdowns.      #
+# ------------------------------------------------------------------- #
+
+TRACE_DIR = os.environ.get("TRACE_DIR")
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'end_ns', 'status')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = 'OK'
+
+    @property
+    def duration(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+class SpanContext:
+    """Reference to a span owned by another process (e.g. a worker whose wait the runner polls)."""
+    __slots__ = ('trace_id', 'span_id')
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Tracer:
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self.trace_id = secrets.token_hex(16)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def start_span(self, name: str, **attributes) -> Span:
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, parent.trace_id if parent else self.trace_id, parent.span_id if parent else None,
+                    attributes)
+        stack.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def attached(self, parent):
+        """Parent spans started on this thread to `parent` (a Span or SpanContext) for the block."""
+        if parent is None:
+            yield
+            return
+        stack = self._stack()
+        stack.append(parent)
+        try:
+            yield
+        finally:
+            if stack and stack[-1] is parent:
+                stack.pop()
+
+    def end_span(self, span: Span, status: str = 'OK') -> None:
+        if span.end_ns is not None:
+            return
+        stack = self._stack()
+        # close children left open by an early exit/exception first
+        while stack and stack[-1] is not span:
+            self._finish(stack.pop(), 'UNSET')
+        if stack:
+            stack.pop()
+        self._finish(span, status)
+
+    def current(self) -> Span | None:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def set_attribute(self, key: str, value) -> None:
+        span = self.current()
+        if isinstance(span, Span):
+            span.attributes[key] = value
+
+    def close_all(self, status: str = 'ERROR') -> None:
+        stack = self._stack()
+        while stack:
+            self._finish(stack.pop(), status)
+        with self._lock:
+            if self._file:
+                self._file.flush()
+
+    def _finish(self, span: Span, status: str) -> None:
+        span.end_ns = time.time_ns()
+        span.status = status
+        if not self.directory:
+            return
+        line = json.dumps(span.to_dict()) + '\n'
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = open(os.path.join(self.directory, f'trace_{os.getpid()}.jsonl'), 'a',
+                                  encoding='utf-8')
+            self._file.write(line)
+
+
+class span:
+    """Context manager: `with tracing.span('supabase upsert esim_results'):`"""
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+
+    def __enter__(self) -> Span:
+        self.span = TRACER.start_span(self.name, **self.attributes)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and exc_type is not SystemExit:
+            self.span.attributes['exception'] = repr(exc)
+        TRACER.end_span(self.span, 'ERROR' if exc_type else 'OK')
+        return False
+
+
+class TracingClock(clock.Clock):
+    """Wraps the active clock so every workflow sleep becomes a 'sleep' span."""
+
+    def __init__(self, inner: clock.Clock):
+        self.inner = inner
+        self.scale = inner.scale
+
+    def time(self) -> float:
+        return self.inner.time()
+
+    def sleep(self, seconds: float) -> None:
+        caller = sys._getframe(2)  # skip clock.sleep()
+        with span('sleep', wait=True, seconds=seconds,
+                  function=caller.f_code.co_name, lineno=caller.f_lineno):
+            self.inner.sleep(seconds)
+
+
+TRACER = Tracer(TRACE_DIR)
+start_span = TRACER.start_span
+end_span = TRACER.end_span
+set_attribute = TRACER.set_attribute
+
+
+def install() -> None:
+    """Trace sleeps and flush open spans at exit; no-op without TRACE_DIR."""
+    if not TRACE_DIR:
+        return
+    clock.set_clock(TracingClock(clock.get_clock()))
+    atexit.register(TRACER.close_all)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import os
+import sys
+import datetime
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from TealUS import PLANS, INFLIGHT, UnknownOperation, get_esim_info, get_operation_result
+from operation_poller import OperationPoller
+
+# ------------------------------------------------------------------- #
+#  Pre-flight triage: one eSIM info query per EID, all submitted up   #
+#  front and collected through one OperationPoller, then each EID is  #
+#  sorted into                                                        #
+#    COMPLETE          all plans active      -> mark SUCCESS now      #
+#    PARTIAL           active, plans missing -> start at assignment   #
+#    NEEDS_ACTIVATION  inactive / unknown    -> full workflow         #
+#    DEFERRED          active but offline    -> not started this run  #
+# ------------------------------------------------------------------- #
+
+TRIAGE_CONCURRENCY = int(os.environ.get("TRIAGE_CONCURRENCY", "20"))
+TRIAGE_WAIT_SECONDS = 30
+
+COMPLETE = 'COMPLETE'
+PARTIAL = 'PARTIAL'
+NEEDS_ACTIVATION = 'NEEDS_ACTIVATION'
+DEFERRED = 'DEFERRED'
+
+
+@dataclass
+class TriageResult:
+    eid: str
+    category: str
+    missing_plans: list[str] = field(default_factory=list)
+    reason: str = ''
+
+
+def classify(eid: str, entry: dict | None) -> TriageResult:
+    """Sort one eSIM info entry into a triage category."""
+    if not entry:
+        return TriageResult(eid, NEEDS_ACTIVATION, [plan['name'] for plan in PLANS], 'no eSIM info')
+    if not entry.get('active'):
+        return TriageResult(eid, NEEDS_ACTIVATION, [plan['name'] for plan in PLANS], 'eSIM not active')
+
+    # same test as TealUS.already_active()
+    active_uuids = {cp.get('planUuid') for cp in entry.get('connectionProfileEntries', [])
+                    if cp.get('active') is True}
+    missing = [plan['name'] for plan in PLANS if plan['uuid'] not in active_uuids]
+    if not missing:
+        return TriageResult(eid, COMPLETE, [], 'all plans active')
+    if entry.get('deviceStatus') != 'ONLINE':
+        return TriageResult(eid, DEFERRED, missing, f"device {entry.get('deviceStatus')}")
+    return TriageResult(eid, PARTIAL, missing, f"missing {'/'.join(missing)}")
+
+
+def _submit(eid: str, parent=None, log=print) -> str | None:
+    try:
+        with tracing.TRACER.attached(parent):
+            _, request_id = get_esim_info(eid)
+        return request_id
+    except Exception as e:
+        log(f"Triage: eSIM info request failed for {eid}: {e}")
+        return None
+
+
+def query_info(eids: list[str], concurrency: int = TRIAGE_CONCURRENCY,
+               poller: OperationPoller | None = None, log=print) -> dict[str, dict | None]:
+    """
+    eSIM info entry per EID (None when it could not be fetched). Results are
+    collected through `poller` (the runner's batch poller) or a private one;
+    failures are reported through `log`.
+    """
+    entries = {eid: None for eid in eids}
+    own_poller = poller is None
+    if own_poller:
+        poller = OperationPoller(get_operation_result, concurrency=concurrency)
+    futures = {}
+    parent = tracing.TRACER.current()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # each result is polled TRIAGE_WAIT_SECONDS after its own submission, 102s are rescheduled
+        for eid, request_id in zip(eids, pool.map(lambda eid: _submit(eid, parent, log), eids)):
+            if request_id:
+                futures[eid] = request_id, poller.submit(request_id, delay=TRIAGE_WAIT_SECONDS)
+
+    for eid, (request_id, future) in futures.items():
+        try:
+            result = future.result()
+        except Exception as e:
+            log(f"Triage: operation result failed for {eid}: {e}")
+            continue
+        if result is not None:
+            INFLIGHT.resolve(request_id)
+        result_entries = (result or {}).get('entries') or []
+        entries[eid] = result_entries[0] if result_entries else None
+    if own_poller:
+        poller.close()
+    return entries
+
+
+def triage_batch(eids: list[str], concurrency: int = TRIAGE_CONCURRENCY,
+                 poller: OperationPoller | None = None, log=print) -> dict[str, TriageResult]:
+    entries = query_info(eids, concurrency, poller, log)
+    return {eid: classify(eid, entries[eid]) for eid in eids}
+
+
+def store_results(supabase, batch_id: str, results: dict[str, TriageResult], chunk_size: int = 500,
+                  log=print) -> None:
+    """Record the triage outcome on each EID's esim_results row."""
+    if not supabase or not batch_id or batch_id == "local":
+        return
+
+    now = datetime.datetime.utcnow()
+    # upsert() sends the union of a chunk's keys and NULLs whatever a row lacks, so rows
+    # are grouped by key set: PARTIAL / NEEDS_ACTIVATION rows must not touch status or ICCIDs
+    groups: dict[tuple, list[dict]] = {}
+    for result in results.values():
+        row = {
+            'batch_id': batch_id,
+            'eid': result.eid,
+            'triage_category': result.category,
+            'triage_missing_plans': ','.join(result.missing_plans) or None,
+            'updated_at': now.isoformat(),
+        }
+        if result.category == COMPLETE:
+            row.update({
+                'status': 'SUCCESS',
+                'processing_started_at': now.isoformat(),
+                'processing_completed_at': now.isoformat(),
+            })
+            for plan in PLANS:
+                name = plan['name'].lower()
+                row.update({
+                    f'{name}_status': 'SUCCESS',
+                    f'{name}_iccid': 'Already active',
+                    f'{name}_timestamp': now.strftime('%d/%m/%Y %H:%M:%S'),
+                })
+        elif result.category == DEFERRED:
+            row['status'] = 'DEFERRED'
+        groups.setdefault(tuple(row), []).append(row)
+
+    for rows in groups.values():
+        for i in range(0, len(rows), chunk_size):
+            try:
+                supabase.table('esim_results').upsert(rows[i:i + chunk_size], on_conflict='batch_id,eid').execute()
+            except Exception as e:
+                log(f"Failed to store triage results: {e}")
+
+
+def summarise(results: dict[str, TriageResult]) -> dict[str, int]:
+    counts = {COMPLETE: 0, PARTIAL: 0, NEEDS_ACTIVATION: 0, DEFERRED: 0}
+    for result in results.values():
+        counts[result.category] += 1
+    return counts
+
+
+def main():
+    """Dry run: read EIDs (one per line) from stdin and print their triage category."""
+    eids = [line.split(',')[0].strip() for line in sys.stdin if line.strip()]
+    results = triage_batch(eids)
+    for result in results.values():
+        print(f"{result.eid}: {result.category} ({result.reason})")
+    print(", ".join(f"{category}={n}" for category, n in summarise(results).items()))
+
+
+if __name__ == '__main__':
+    main()